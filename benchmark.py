@@ -0,0 +1,339 @@
+"""
+Benchmark syncing from Workday to Loop against local stand-in servers
+"""
+
+from argparse import ArgumentParser, Namespace
+from contextlib import redirect_stdout
+from gzip import decompress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from json import dumps, loads
+from multiprocessing import Process, Queue
+from re import fullmatch
+from resource import RUSAGE_SELF, getrusage
+from threading import Thread
+from time import monotonic, sleep
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from loop_workday_upload.client import LoopClient, WorkdayClient
+from loop_workday_upload.metrics import METRICS
+from loop_workday_upload.pipeline import add_pipeline_arguments, get_pipeline_settings
+from loop_workday_upload.search import (
+    DEFAULT_SEARCH_PROMPTS,
+    load_search_profiles,
+    search_for_expense_reports_concurrently,
+    search_for_expense_reports_directly,
+)
+from loop_workday_upload.state import SyncContext
+from loop_workday_upload.sync import sync_all
+
+CHUNKING_URL = "/gatech/chunking/benchmark"
+
+GET_LINE_URL = "/gatech/inst/benchmark/line"
+
+FLOW_EXECUTION_KEY = "benchmark-flow"
+
+SESSION_SECURE_TOKEN = "benchmark-token"
+
+
+def pad_widgets(widgets: Dict[str, Any], size: int) -> Dict[str, Any]:
+    """
+    Add layout widgets that Loop ignores until a payload is about the given size, like real Workday responses
+    """
+    layout: List[Dict[str, Any]] = []
+
+    while len(dumps(widgets)) + 80 * len(layout) < size:
+        layout.append({"widget": "layout", "id": f"layout-{len(layout)}", "label": "", "children": []})
+
+    widgets["layout"] = layout
+    return widgets
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Request handler that serves synthetic Workday and Loop responses, depending on the path
+    """
+
+    protocol_version = "HTTP/1.1"
+    config: Dict[str, Any] = {}
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        """
+        Don't log every request
+        """
+
+    def read_body(self) -> bytes:
+        """
+        Read the request body, decoding chunked and compressed uploads
+        """
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            body = bytearray(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        else:
+            body = bytearray()
+
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+
+                if size == 0:
+                    self.rfile.readline()
+                    break
+
+                body += self.rfile.read(size)
+                self.rfile.readline()
+
+        if self.headers.get("Content-Encoding", "") == "gzip":
+            return decompress(body)
+
+        return bytes(body)
+
+    def respond(self, body: Any, content_type: str = "application/json") -> None:
+        """
+        Send a successful response after the configured latency
+        """
+        encoded = body if isinstance(body, bytes) else dumps(body).encode()
+        latency = self.config["workday_latency"] if self.path.startswith("/gatech/") else self.config["loop_latency"]
+        sleep(latency)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def entities(self, report_ids: List[int]) -> Dict[str, List[str]]:
+        """
+        Build the entities Loop would ask to sync for a set of expense reports
+        """
+        workers = sorted({str(report_id % self.config["workers"]) for report_id in report_ids})
+
+        return {
+            "workers": workers,
+            "external-committee-members": workers,
+            "expense-reports": [str(report_id) for report_id in report_ids],
+        }
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Serve Workday pages and attachments, and Loop's list of entities to sync
+        """
+        config = self.config
+
+        if match := fullmatch(r"/gatech/inst/1\$1356/1356\$(\d+)\.htmld", self.path):
+            report_id = match.group(1)
+            self.respond(
+                pad_widgets(
+                    {
+                        "actions": {"widget": "extensionActions", "extensionActions": [{"uri": GET_LINE_URL}]},
+                        "lines": {
+                            "label": "Expense Lines",
+                            "rows": [{"id": f"{report_id}-{line}"} for line in range(config["lines"])],
+                        },
+                    },
+                    config["payload_size"],
+                )
+            )
+        elif fullmatch(r"/gatech/inst/1\$37/247\$\d+\.htmld", self.path):
+            self.respond(pad_widgets({"widget": "worker"}, config["payload_size"]))
+        elif fullmatch(r"/gatech/attachment/1074\$[\d-]+/\w+\.htmld", self.path):
+            self.respond(b"\0" * config["attachment_size"], "application/pdf")
+        elif self.path == "/gatech/d/task/1422$269.htmld":
+            self.respond(
+                pad_widgets(
+                    {"flowExecutionKey": FLOW_EXECUTION_KEY, "sessionSecureToken": SESSION_SECURE_TOKEN},
+                    config["payload_size"],
+                )
+            )
+        elif self.path == "/api/v1/workday/sync":
+            self.respond(self.entities(list(range(config["reports"]))))
+        else:
+            self.send_error(404)
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """
+        Serve Workday search results and records, and accept uploads to Loop
+        """
+        config = self.config
+        body = self.read_body()
+
+        if self.path == "/gatech/flowController.htmld":
+            form = parse_qs(body.decode())
+
+            # Workday rejects a submission that doesn't continue the flow the search form started
+            if form.get("_flowExecutionKey") != [FLOW_EXECUTION_KEY] or form.get("sessionSecureToken") != [
+                SESSION_SECURE_TOKEN
+            ]:
+                self.send_error(400)
+            else:
+                self.respond({"body": {"children": [{}, {}, {"chunkingUrl": CHUNKING_URL}]}})
+        elif self.path == f"{CHUNKING_URL}.htmld":
+            form = parse_qs(body.decode())
+            start_row = int(form["startRow"][0])
+            end_row = min(config["reports"], start_row - 1 + int(form["maxRows"][0]))
+            self.respond(
+                {"body": {"children": [{}, {}, {"rows": [{"id": row} for row in range(start_row - 1, end_row)]}]}}
+            )
+        elif self.path == f"{GET_LINE_URL}.htmld":
+            line_id = parse_qs(body.decode())["id"][0]
+            self.respond(
+                pad_widgets(
+                    {
+                        "attachments": [
+                            {"instanceId": f"1074${line_id}-{attachment}", "target": "file", "text": "receipt.pdf"}
+                            for attachment in range(config["attachments"])
+                        ]
+                    },
+                    config["payload_size"],
+                )
+            )
+        elif fullmatch(r"/gatech/inst/1\$15341/15341\$\d+\.htmld", self.path):
+            self.respond(pad_widgets({"widget": "externalCommitteeMember"}, config["payload_size"]))
+        elif self.path == "/api/v1/workday/expense-reports":
+            rows = loads(body)["body"]["children"][2]["rows"]
+            self.respond(self.entities([row["id"] for row in rows]))
+        elif fullmatch(r"/api/v1/workday/expense-reports/\d+/lines/[\d-]+/attachments/[\d-]+", self.path):
+            self.respond({})
+        elif self.path in ("/api/v1/workday/workers", "/api/v1/workday/external-committee-members"):
+            self.respond({})
+        elif self.path == "/api/v1/workday/sync":
+            self.respond({})
+        else:
+            self.send_error(404)
+
+    def do_PUT(self) -> None:  # pylint: disable=invalid-name
+        """
+        Accept expense reports and lines uploaded to Loop
+        """
+        self.read_body()
+
+        if match := fullmatch(r"/api/v1/workday/expense-reports/\d+/lines/([\d-]+)", self.path):
+            self.respond({"attachments": [f"{match.group(1)}-{a}" for a in range(self.config["attachments"])]})
+        elif fullmatch(r"/api/v1/workday/expense-reports/\d+", self.path):
+            self.respond({})
+        else:
+            self.send_error(404)
+
+
+def serve(config: Dict[str, Any], ports: "Queue[int]") -> None:
+    """
+    Run the stand-in Workday and Loop servers until the process is terminated
+    """
+    StandInHandler.config = config
+    servers = [ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler) for _ in range(2)]
+
+    for server in servers:
+        server.daemon_threads = True
+        ports.put(server.server_address[1])
+        Thread(target=server.serve_forever, daemon=True).start()
+
+    while True:
+        sleep(60)
+
+
+def benchmark(args: Namespace) -> Dict[str, Any]:
+    """
+    Sync a synthetic dataset from the stand-in servers, returning throughput, memory, and request counts
+    """
+    ports: "Queue[int]" = Queue()
+
+    # The servers run in their own process, so they don't count towards the peak memory of the sync
+    server = Process(target=serve, args=(vars(args), ports), daemon=True)
+    server.start()
+
+    try:
+        workday_port = ports.get(timeout=10)
+        loop_port = ports.get(timeout=10)
+
+        workday = WorkdayClient(
+            {}, args.workday_concurrency, args.workday_rate_limit, base_url=f"http://127.0.0.1:{workday_port}"
+        )
+        loop = LoopClient(
+            f"http://127.0.0.1:{loop_port}",
+            "benchmark",
+            args.loop_concurrency,
+            compress=args.compress_uploads,
+            project=args.project_uploads,
+        )
+        context = SyncContext(workday, loop, args.attachment_concurrency, args.line_concurrency)
+
+        pipeline = get_pipeline_settings(args)
+
+        start = monotonic()
+
+        # The sync functions narrate every step, which would swamp the results and slow the run down
+        with redirect_stdout(StringIO()):
+            if args.search_profiles is not None:
+                chunking_urls = search_for_expense_reports_concurrently(
+                    workday, load_search_profiles(args.search_profiles)
+                )
+            elif args.direct_search:
+                chunking_urls = [search_for_expense_reports_directly(workday, DEFAULT_SEARCH_PROMPTS)]
+            else:
+                chunking_urls = [CHUNKING_URL]
+
+            sync_all(context, chunking_urls, args.page_size, args.threads, pipeline)
+
+        elapsed = monotonic() - start
+    finally:
+        server.terminate()
+
+    summary = METRICS.summary()
+    entities = args.reports * (1 + args.lines * (1 + args.attachments)) + 2 * min(args.workers, args.reports)
+
+    return {
+        "elapsed_seconds": elapsed,
+        "entities": entities,
+        "entities_per_second": entities / elapsed,
+        "peak_rss_kilobytes": getrusage(RUSAGE_SELF).ru_maxrss,
+        "requests": {host: stats["requests"] for host, stats in summary["hosts"].items()},
+        "bytes_sent": {host: stats["bytes_sent"] for host, stats in summary["hosts"].items()},
+        "phases": summary["phases"],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Entrypoint for benchmark
+    """
+    parser = ArgumentParser(
+        description="Benchmark syncing from Workday to Loop against local stand-in servers",
+        allow_abbrev=False,
+    )
+    parser.add_argument("--reports", help="the number of expense reports", type=int, default=100)
+    parser.add_argument("--lines", help="the number of lines on each expense report", type=int, default=3)
+    parser.add_argument("--attachments", help="the number of attachments on each line", type=int, default=1)
+    parser.add_argument("--workers", help="the number of distinct workers", type=int, default=20)
+    parser.add_argument(
+        "--payload-size", help="the approximate size of each Workday JSON payload, in bytes", type=int, default=50000
+    )
+    parser.add_argument("--attachment-size", help="the size of each attachment, in bytes", type=int, default=1000000)
+    parser.add_argument(
+        "--workday-latency", help="the delay before Workday responds, in seconds", type=float, default=0.1
+    )
+    parser.add_argument("--loop-latency", help="the delay before Loop responds, in seconds", type=float, default=0.02)
+    parser.add_argument("--page-size", help="the number of search results per page", type=int, default=500)
+    parser.add_argument("--threads", help="the number of entities to sync in parallel", type=int, default=1)
+    parser.add_argument("--workday-concurrency", help="the maximum requests to Workday", type=int, default=4)
+    parser.add_argument("--loop-concurrency", help="the maximum requests to Loop", type=int, default=4)
+    parser.add_argument("--workday-rate-limit", help="the maximum requests per second to Workday", type=float)
+    parser.add_argument(
+        "--attachment-concurrency", help="the number of attachments to transfer in parallel", type=int, default=2
+    )
+    parser.add_argument(
+        "--line-concurrency", help="the number of lines of each expense report to sync in parallel", type=int, default=1
+    )
+    add_pipeline_arguments(parser)
+    parser.add_argument(
+        "--direct-search", help="search for expense reports over HTTP before syncing", action="store_true"
+    )
+    parser.add_argument("--search-profiles", help="the path to a JSON file of search profiles to run before syncing")
+    parser.add_argument("--compress-uploads", help="gzip Workday payloads uploaded to Loop", action="store_true")
+    parser.add_argument(
+        "--project-uploads", help="strip values that carry no data out of uploads to Loop", action="store_true"
+    )
+    args = parser.parse_args(argv)
+
+    print(dumps(benchmark(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+Upload data from Workday to Loop
+"""
+
+from loop_workday_upload.cli import main
+
+__all__ = ["main"]
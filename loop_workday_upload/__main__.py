@@ -0,0 +1,7 @@
+"""
+Run the command line interface with python -m loop_workday_upload
+"""
+
+from loop_workday_upload.cli import main
+
+main()
@@ -0,0 +1,367 @@
+"""
+Logging in to and searching Workday with a browser, and saving the session it creates
+"""
+
+from base64 import urlsafe_b64encode
+from hashlib import pbkdf2_hmac
+from json import JSONDecodeError, dumps, loads
+from os import O_CREAT, O_TRUNC, O_WRONLY, fchmod, fdopen, open as os_open
+from re import escape
+from secrets import token_bytes
+from threading import Event
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from loop_workday_upload.client import WORKDAY_BASE_URL
+from loop_workday_upload.metrics import timed
+from loop_workday_upload.widgets import find_chunking_url
+
+if TYPE_CHECKING:
+    from seleniumwire.webdriver import Chrome  # type: ignore
+
+FLOW_CONTROLLER_URL = "https://wd5.myworkday.com/gatech/flowController.htmld"
+
+
+# Number of days to reuse a downloaded chromedriver before checking for a newer one
+CHROMEDRIVER_CACHE_DAYS = 30
+
+
+# Resources the browser doesn't need to download to log in and search
+BLOCKED_RESOURCE_PATTERNS = [
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.svg",
+    "*.ico",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+    "*.mp4",
+    "*.webm",
+]
+
+
+@timed("start-browser")
+def start_browser(chromedriver: Optional[str], headless: bool, profile: Optional[str]) -> "Chrome":
+    """
+    Launch Chrome through the selenium-wire proxy, ready to log in to Workday
+    """
+    # The browser stack takes most of a second to import, so only the functions that drive Chrome import it
+    # pylint: disable=import-outside-toplevel
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    from seleniumwire import webdriver  # type: ignore
+
+    from webdriver_manager.chrome import ChromeDriverManager
+    from webdriver_manager.core.driver_cache import DriverCacheManager
+
+    print("Starting browser")
+    options = Options()
+
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+
+    # A persistent profile keeps Workday's scripts in the browser cache between runs
+    if profile is not None:
+        options.add_argument(f"--user-data-dir={profile}")
+
+    if chromedriver is None:
+        chromedriver = ChromeDriverManager(
+            cache_manager=DriverCacheManager(valid_range=CHROMEDRIVER_CACHE_DAYS)  # type: ignore
+        ).install()
+
+    driver = webdriver.Chrome(service=Service(executable_path=chromedriver), options=options)
+
+    if not headless:
+        driver.maximize_window()
+
+    # Only the search results response is needed, so don't make the proxy capture anything else
+    driver.scopes = [escape(FLOW_CONTROLLER_URL)]
+
+    # Nothing the login and search need depends on images, fonts, or media, so don't download them
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_RESOURCE_PATTERNS})
+
+    return driver
+
+
+@timed("login")
+def log_in_to_workday(driver: "Chrome", username: str, password: str) -> None:
+    """
+    Log in to Workday via CAS
+    """
+    # pylint: disable=import-outside-toplevel
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.wait import WebDriverWait
+
+    print("Starting Workday authentication")
+    driver.get("https://wd5.myworkday.com/gatech/")
+
+    # wait for CAS login page to load
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "username"))
+
+    timeout = 20
+
+    if username is not None and password is not None:
+        # enter username, password, and submit the form
+        username_field = driver.find_element(By.ID, "username")
+        password_field = driver.find_element(By.ID, "password")
+        submit_button = driver.find_element(By.NAME, "submitbutton")
+
+        print("Entering username")
+        username_field.send_keys(username)
+        print("Entering password")
+        password_field.send_keys(password)
+        print("Submitting login form")
+        submit_button.click()
+    else:
+        timeout = 60
+
+    # wait for Duo authentication to finish, redirect to Workday, and wait for Workday to start loading
+    print("Waiting for authentication to complete")
+    wait_for_workday_homepage(driver, timeout)
+
+
+def wait_for_workday_homepage(driver: "Chrome", timeout: int) -> None:
+    """
+    Wait for the Workday homepage to finish loading after logging in
+    """
+    # pylint: disable=import-outside-toplevel
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.wait import WebDriverWait
+
+    WebDriverWait(driver, timeout=timeout).until(lambda d: d.title == "Home - Workday")
+
+    # Wait for the homepage to fully load, because if you don't, it'll close the search window later
+    print("Waiting for homepage to fully load")
+    (
+        WebDriverWait(driver, timeout=10).until(
+            lambda d: d.find_element(By.CSS_SELECTOR, "div[data-automation-id='pex-home-banner']")
+        )
+    )
+
+
+@timed("restore-session")
+def restore_workday_session(driver: "Chrome", cookies: List[Dict[str, Any]]) -> None:
+    """
+    Load a saved Workday session into the browser instead of logging in again
+    """
+    print("Restoring saved Workday session")
+
+    # Cookies can only be set for the domain of the current page, so load a page that won't redirect to CAS first
+    driver.get(f"{WORKDAY_BASE_URL}/robots.txt")
+
+    for cookie in cookies:
+        driver.add_cookie(cookie)
+
+    driver.get("https://wd5.myworkday.com/gatech/")
+    wait_for_workday_homepage(driver, 20)
+
+
+def get_cookie_values(cookies: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Convert cookies from the browser into a mapping of names to values
+    """
+    return {cookie["name"]: cookie["value"] for cookie in cookies}
+
+
+def derive_session_cache_key(passphrase: str, salt: bytes) -> Fernet:
+    """
+    Derive the key for the saved Workday session from a passphrase
+    """
+    return Fernet(urlsafe_b64encode(pbkdf2_hmac("sha256", passphrase.encode(), salt, 600000)))
+
+
+def save_workday_session(path: str, passphrase: str, cookies: List[Dict[str, Any]]) -> None:
+    """
+    Encrypt the browser's Workday cookies and save them to disk for the next run
+    """
+    salt = token_bytes(16)
+
+    # Create the file readable only by its owner, so the cookies are never readable by anyone else, even briefly, and
+    # restrict a file left over from an older version before writing to it
+    descriptor = os_open(path, O_WRONLY | O_CREAT | O_TRUNC, 0o600)
+    fchmod(descriptor, 0o600)
+
+    with fdopen(descriptor, "wb") as file:
+        file.write(salt + derive_session_cache_key(passphrase, salt).encrypt(dumps(cookies).encode()))
+
+    print("Saved Workday session")
+
+
+def load_workday_session(path: str, passphrase: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Load and decrypt a saved Workday session, if there is one
+    """
+    try:
+        with open(path, "rb") as file:
+            contents = file.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        return loads(derive_session_cache_key(passphrase, contents[:16]).decrypt(contents[16:]))  # type: ignore
+    except InvalidToken:
+        print("Could not decrypt saved Workday session")
+        return None
+
+
+@timed("search")
+def search_for_expense_reports(driver: "Chrome") -> str:  # pylint: disable=too-many-locals,too-many-statements
+    """
+    Retrieve all relevant expense reports
+    """
+    # pylint: disable=import-outside-toplevel
+    from selenium.webdriver import ActionChains, Keys  # pylint: disable=no-name-in-module
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.wait import WebDriverWait
+
+    print("Navigating to expense report search")
+    driver.get("https://wd5.myworkday.com/gatech/d/task/1422$269.htmld")
+
+    # Wait for form to load
+    print("Waiting for expense report search form to load")
+    WebDriverWait(driver, timeout=20).until(lambda d: d.title == "Find Expense Reports by Organization - CR - Workday")
+
+    # Enter Companies
+    print("Entering Company")
+    companies_field = driver.find_element(By.ID, "15$378585").find_element(By.TAG_NAME, "input")
+    companies_field.send_keys("CO503 Georgia Institute of Technology" + Keys.ENTER)
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "pill-2501$1"))
+
+    # Enter Student Life Cost Center
+    print("Entering Student Life Cost Center")
+    cost_center_field = driver.find_element(By.ID, "ExternalField146_7227PromptQualifier1").find_element(
+        By.TAG_NAME, "input"
+    )
+    cost_center_field.send_keys("CC000375" + Keys.ENTER)
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "pill-2502$367"))
+
+    print("Entering Mechanical Engineering Cost Center")
+    cost_center_field = driver.find_element(By.ID, "ExternalField146_7227PromptQualifier1").find_element(
+        By.TAG_NAME, "input"
+    )
+    cost_center_field.send_keys("CC000259" + Keys.ENTER)
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "pill-2502$180"))
+
+    # Enter Work Tags
+    print("Entering Custodial Entity worktag")
+    work_tags_field = driver.find_element(By.ID, "ExternalField146_4946PromptQualifier1").find_element(
+        By.TAG_NAME, "input"
+    )
+    work_tags_field.send_keys("CE0339" + Keys.ENTER)
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "pill-2506$9979"))
+    print("Entering Designated Entity worktag")
+    work_tags_field.send_keys("DE00007513" + Keys.ENTER)
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "pill-2506$38743"))
+    print("Entering Gift account worktag")
+    work_tags_field.send_keys("GTF250000211" + Keys.ENTER)
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "pill-8261$1948"))
+    print("Entering Gift account worktag")
+    work_tags_field.send_keys("GTF551000258" + Keys.ENTER)
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "pill-8261$7425"))
+    print("Entering External Committee Member worktag")
+    work_tags_field.send_keys("robojackets inc" + Keys.ENTER)
+    WebDriverWait(driver, timeout=20).until(lambda d: d.find_element(By.ID, "menuItem-15341$7955"))
+    driver.find_element(By.ID, "menuItem-15341$7955").click()
+    WebDriverWait(driver, timeout=20).until(lambda d: d.find_element(By.ID, "pill-15341$7955"))
+    print("Entering External Committee Member worktag")
+    work_tags_field.send_keys("robo jackets" + Keys.ENTER)
+    WebDriverWait(driver, timeout=20).until(lambda d: d.find_element(By.ID, "menuItem-15341$1787"))
+
+    # Tab over to Report Date On or After
+    print("Entering Report Date On or After")
+    ActionChains(driver).send_keys("".join([Keys.TAB] * 3)).perform()
+
+    date_div = driver.find_element(By.ID, "ExternalField146_13403PromptQualifier2")
+
+    date_inputs = date_div.find_elements(By.TAG_NAME, "input")
+
+    year_input = None
+    month_input = None
+    day_input = None
+
+    for date_input in date_inputs:
+        if "Month" == date_input.get_attribute("aria-label"):
+            month_input = date_input
+        elif "Day" == date_input.get_attribute("aria-label"):
+            day_input = date_input
+        elif "Year" == date_input.get_attribute("aria-label"):
+            year_input = date_input
+
+    assert month_input is not None
+    assert day_input is not None
+    assert year_input is not None
+
+    ActionChains(driver).send_keys("01").perform()
+    WebDriverWait(driver, timeout=10).until(lambda d: month_input.get_property("value") == "1")
+    ActionChains(driver).send_keys("01").perform()
+    WebDriverWait(driver, timeout=10).until(lambda d: day_input.get_property("value") == "1")
+    ActionChains(driver).send_keys("2023").perform()
+    WebDriverWait(driver, timeout=10).until(lambda d: year_input.get_property("value") == "2023")
+
+    # Enter Payee Type
+    print("Entering Payee Type")
+    payee_type_field = driver.find_element(By.ID, "ExternalField3285_1140PromptQualifier1").find_element(
+        By.TAG_NAME, "input"
+    )
+    payee_type_field.click()
+
+    # Wait for dropdown to populate
+    WebDriverWait(driver, timeout=10).until(lambda d: d.find_element(By.ID, "menuItem-9572$14"))
+
+    # Click External Committee Member
+    external_committee_member_checkbox = driver.find_element(By.ID, "menuItem-9572$14")
+    external_committee_member_checkbox.click()
+
+    interceptor = ChunkingUrlInterceptor()
+    driver.response_interceptor = interceptor
+
+    # Click OK
+    print("Submitting form")
+    driver.find_element(By.CSS_SELECTOR, "button[data-automation-id='wd-CommandButton_uic_okButton']").click()
+
+    # Wait for the search results response, rather than for the results to render
+    print("Waiting for report results to load")
+    found = interceptor.found.wait(timeout=30)
+
+    del driver.response_interceptor
+
+    if found and interceptor.chunking_url is not None:
+        print("Found chunking URL")
+        return interceptor.chunking_url
+
+    raise ValueError("Could not find chunkingUrl")
+
+
+class ChunkingUrlInterceptor:  # pylint: disable=too-few-public-methods
+    """
+    selenium-wire response interceptor that picks chunkingUrl out of flowController responses as they arrive
+    """
+
+    def __init__(self) -> None:
+        self.chunking_url: Optional[str] = None
+        self.found = Event()
+
+    def __call__(self, request: Any, response: Any) -> None:
+        from seleniumwire.utils import decode  # type: ignore  # pylint: disable=import-outside-toplevel
+
+        if request.url != FLOW_CONTROLLER_URL or response.status_code != 200:
+            return
+
+        try:
+            chunking_url = find_chunking_url(
+                loads(decode(response.body, response.headers.get("Content-Encoding", "identity")))
+            )
+        except JSONDecodeError:
+            print("Failed to decode JSON")
+            return
+
+        if chunking_url is not None:
+            self.chunking_url = chunking_url
+            self.found.set()
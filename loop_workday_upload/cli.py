@@ -0,0 +1,465 @@
+"""
+Command line interface, including connecting to Workday and running as a daemon
+"""
+
+from argparse import ArgumentParser, Namespace
+from datetime import timedelta
+from json import dumps
+from time import monotonic, sleep
+from typing import List, Optional, TYPE_CHECKING, Tuple
+
+from loop_workday_upload.browser import (
+    get_cookie_values,
+    load_workday_session,
+    log_in_to_workday,
+    restore_workday_session,
+    save_workday_session,
+    search_for_expense_reports,
+    start_browser,
+)
+from loop_workday_upload.client import LoopClient, WorkdayClient, get_retry_delay
+from loop_workday_upload.metrics import METRICS
+from loop_workday_upload.pipeline import PipelineSettings, add_pipeline_arguments, get_pipeline_settings
+from loop_workday_upload.search import (
+    DEFAULT_SEARCH_PROMPTS,
+    SearchPrompts,
+    load_search_profiles,
+    search_for_expense_reports_concurrently,
+    try_search_for_expense_reports_directly,
+)
+from loop_workday_upload.state import Journal, SyncCache, SyncContext
+from loop_workday_upload.sync import sync_all, sync_requested
+
+if TYPE_CHECKING:
+    from seleniumwire.webdriver import Chrome  # type: ignore
+
+# Number of times to check the Workday session before deciding it has expired, so a blip doesn't force a login
+KEEPALIVE_ATTEMPTS = 3
+
+
+def search_without_browser(
+    args: Namespace, workday: WorkdayClient, searches: Optional[List[SearchPrompts]]
+) -> Optional[List[str]]:
+    """
+    Search for expense reports over HTTP if requested, returning None if the browser needs to search instead
+    """
+    # Search profiles can only be run over HTTP, since the browser search only knows how to enter the default values
+    if searches is not None:
+        return search_for_expense_reports_concurrently(workday, searches)
+
+    if args.direct_search:
+        chunking_url = try_search_for_expense_reports_directly(workday, DEFAULT_SEARCH_PROMPTS)
+
+        if chunking_url is not None:
+            return [chunking_url]
+
+    return None
+
+
+def log_in(args: Namespace) -> Tuple[WorkdayClient, Optional["Chrome"]]:
+    """
+    Authenticate to Workday, reusing the saved session if it is still logged in, and return the browser if one had to
+    be launched so a search can use it before it is closed
+    """
+    saved_cookies = None
+
+    if args.session_cache is not None:
+        saved_cookies = load_workday_session(args.session_cache, args.session_cache_key)
+
+    if saved_cookies is not None:
+        workday = WorkdayClient(
+            get_cookie_values(saved_cookies), args.workday_concurrency, args.workday_rate_limit, args.retries
+        )
+
+        if workday.is_logged_in():
+            return workday, None
+
+        print("Saved Workday session has expired")
+        saved_cookies = None
+
+    driver = start_browser(args.chromedriver, args.headless, args.chrome_profile)
+
+    try:
+        if saved_cookies is None:
+            log_in_to_workday(driver, args.georgia_tech_username, args.georgia_tech_password)
+        else:
+            restore_workday_session(driver, saved_cookies)
+
+        if args.session_cache is not None:
+            save_workday_session(args.session_cache, args.session_cache_key, driver.get_cookies())
+    except Exception:
+        driver.quit()
+        raise
+
+    workday = WorkdayClient(
+        get_cookie_values(driver.get_cookies()), args.workday_concurrency, args.workday_rate_limit, args.retries
+    )
+
+    return workday, driver
+
+
+def search_with_browser(args: Namespace, workday: WorkdayClient, driver: "Chrome") -> List[str]:
+    """
+    Search for expense reports using the search form, then copy any cookies Workday updated back into the client
+    """
+    chunking_urls = [search_for_expense_reports(driver)]
+
+    # Workday may have updated cookies while the search form was in use
+    workday.session.cookies.update(get_cookie_values(driver.get_cookies()))
+
+    if args.session_cache is not None:
+        save_workday_session(args.session_cache, args.session_cache_key, driver.get_cookies())
+
+    return chunking_urls
+
+
+def find_expense_reports(args: Namespace, workday: WorkdayClient, driver: Optional["Chrome"] = None) -> List[str]:
+    """
+    Search for expense reports with the current session, only using a browser if the search can't be done over HTTP
+    """
+    searches = None if args.search_profiles is None else load_search_profiles(args.search_profiles)
+    chunking_urls = search_without_browser(args, workday, searches)
+
+    if chunking_urls is not None:
+        return chunking_urls
+
+    if driver is None:
+        # Restoring the session the client is already using avoids logging in through CAS and Duo again
+        driver = start_browser(args.chromedriver, args.headless, args.chrome_profile)
+
+        try:
+            restore_workday_session(driver, [{"name": c.name, "value": c.value} for c in workday.session.cookies])
+
+            return search_with_browser(args, workday, driver)
+        finally:
+            driver.quit()
+
+    return search_with_browser(args, workday, driver)
+
+
+def connect_to_workday(args: Namespace) -> Tuple[WorkdayClient, List[str]]:
+    """
+    Authenticate to Workday and search for expense reports, only launching a browser if necessary
+    """
+    workday, driver = log_in(args)
+
+    try:
+        return workday, find_expense_reports(args, workday, driver)
+    finally:
+        # Everything else uses the cookies copied from the browser, so it doesn't need to stay open
+        if driver is not None:
+            driver.quit()
+
+
+def is_session_alive(workday: WorkdayClient) -> bool:
+    """
+    Check whether the Workday session is still logged in, trying again in case a request failed for another reason
+    """
+    for attempt in range(KEEPALIVE_ATTEMPTS):
+        if workday.is_logged_in():
+            return True
+
+        if attempt + 1 < KEEPALIVE_ATTEMPTS:
+            sleep(get_retry_delay(attempt))
+
+    return False
+
+
+def watch(
+    args: Namespace, context: SyncContext, chunking_urls: List[str], pipeline: Optional[PipelineSettings] = None
+) -> None:
+    """
+    Keep the Workday session alive and sync whatever Loop requests as it is requested, searching Workday again
+    periodically, until interrupted
+    """
+    now = monotonic()
+    next_search = now
+    next_poll = now
+    next_keepalive = now + args.keepalive_interval
+    first_run = True
+    # The search done while connecting is fresh, so only later full syncs need to search again
+    search_results: Optional[List[str]] = chunking_urls
+
+    while True:
+        if monotonic() >= next_keepalive:
+            # Logging in can fail in many ways, from a Duo timeout to the browser crashing, none of which should stop
+            # the daemon, so it is tried again at the next keepalive like a failed sync is tried again at the next poll
+            try:
+                if not is_session_alive(context.workday):
+                    print("Workday session has expired, logging in again")
+                    context.workday, driver = log_in(args)
+
+                    # The session is all that is needed until the next search, which can restore it into a browser
+                    if driver is not None:
+                        driver.quit()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"Logging in failed, trying again in {args.keepalive_interval} seconds: {e!r}")
+
+            next_keepalive = monotonic() + args.keepalive_interval
+
+        if monotonic() >= next_poll:
+            # A journal being resumed belongs to the first run, so only later runs start afresh
+            if not first_run:
+                context.start_run()
+
+            first_run = False
+
+            try:
+                if monotonic() >= next_search:
+                    # A failed full sync also waits for the next search, since the results it used may have expired
+                    results, search_results = search_results, None
+                    next_search = monotonic() + args.search_interval
+
+                    if results is None:
+                        results = find_expense_reports(args, context.workday)
+
+                    sync_all(context, results, args.page_size, args.threads, pipeline)
+                else:
+                    sync_requested(context, args.threads, pipeline)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"Sync failed, trying again in {args.poll_interval} seconds: {e!r}")
+
+            write_metrics(args)
+            next_poll = monotonic() + args.poll_interval
+
+        sleep(max(0, min(next_poll, next_keepalive) - monotonic()))
+
+
+def upload(args: Namespace) -> None:
+    """
+    Log in to Workday, then sync everything Loop needs
+    """
+    loop = LoopClient(
+        args.server, args.token, args.loop_concurrency, args.retries, args.compress_uploads, args.project_uploads
+    )
+
+    workday, chunking_urls = connect_to_workday(args)
+
+    cache = None if args.cache is None else SyncCache(args.cache, timedelta(days=args.cache_max_age))
+
+    journal = None if args.journal is None else Journal(args.journal, args.resume)
+
+    pipeline = get_pipeline_settings(args)
+
+    context = SyncContext(workday, loop, args.attachment_concurrency, args.line_concurrency, cache, args.force, journal)
+
+    try:
+        if args.daemon:
+            watch(args, context, chunking_urls, pipeline)
+        else:
+            sync_all(context, chunking_urls, args.page_size, args.threads, pipeline)
+    finally:
+        if cache is not None:
+            cache.close()
+
+        if journal is not None:
+            journal.close()
+
+
+def write_metrics(args: Namespace) -> None:
+    """
+    Write the metrics collected so far to the requested files, if any
+    """
+    if args.metrics_file is not None:
+        with open(args.metrics_file, "w", encoding="utf-8") as file:
+            file.write(dumps(METRICS.summary()))
+
+    if args.prometheus_textfile is not None:
+        METRICS.write_prometheus_textfile(args.prometheus_textfile)
+
+
+def main() -> None:  # pylint: disable=too-many-statements
+    """
+    Entrypoint for script
+    """
+    parser = ArgumentParser(
+        description="Upload data from Workday to Loop",
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--server",
+        help="the base URL of the Loop server",
+        required=True,
+    )
+    parser.add_argument(
+        "--token",
+        help="the token to authenticate to Loop",
+        required=True,
+    )
+    parser.add_argument(
+        "--georgia-tech-username",
+        help="the Georgia Tech username to authenticate to Workday",
+        required=False,
+    )
+    parser.add_argument(
+        "--georgia-tech-password",
+        help="the Georgia Tech password to authenticate to Workday",
+        required=False,
+    )
+    parser.add_argument(
+        "--threads",
+        help="the number of entities to sync in parallel",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--workday-concurrency",
+        help="the maximum number of simultaneous requests to Workday",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--loop-concurrency",
+        help="the maximum number of simultaneous requests to Loop",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--retries",
+        help="the number of times to retry a request that was throttled or failed in a way that is safe to retry",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "--workday-rate-limit",
+        help="the maximum average number of requests per second to Workday",
+        type=float,
+    )
+    parser.add_argument(
+        "--line-concurrency",
+        help="the number of lines to sync in parallel for each expense report, without --pipeline",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--attachment-concurrency",
+        help="the number of attachments to transfer in parallel for each expense report line",
+        type=int,
+        default=2,
+    )
+    add_pipeline_arguments(parser)
+    parser.add_argument(
+        "--page-size",
+        help="the number of search results to retrieve from Workday and upload to Loop at a time",
+        type=int,
+        default=500,
+    )
+    parser.add_argument(
+        "--cache",
+        help="the path to a SQLite database used to skip uploading entities that haven't changed since the last run",
+        required=False,
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        help="the number of days after which cached entities are uploaded again even if unchanged",
+        type=float,
+        default=30,
+    )
+    parser.add_argument(
+        "--force",
+        help="upload every entity to Loop, even if it is unchanged in the cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--journal",
+        help="the path to a file recording each entity as it is completely synced",
+        required=False,
+    )
+    parser.add_argument(
+        "--resume",
+        help="continue the last run in the journal if it did not finish, skipping entities it already completed",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--session-cache",
+        help="the path to save the Workday session to, so later runs can skip logging in while it is still valid",
+        required=False,
+    )
+    parser.add_argument(
+        "--session-cache-key",
+        help="the passphrase to encrypt the saved Workday session",
+        required=False,
+    )
+    parser.add_argument(
+        "--direct-search",
+        help="submit the expense report search over HTTP instead of through the browser, falling back to the browser"
+        " if it fails",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--search-profiles",
+        help="the path to a JSON file of search profiles to run concurrently over HTTP, instead of the default search",
+        required=False,
+    )
+    parser.add_argument(
+        "--chromedriver",
+        help="the path to a chromedriver binary, instead of looking up and downloading one",
+        required=False,
+    )
+    parser.add_argument(
+        "--headless",
+        help="run Chrome without a window",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--chrome-profile",
+        help="the path to a Chrome profile directory to reuse between runs",
+        required=False,
+    )
+    parser.add_argument(
+        "--compress-uploads",
+        help="gzip Workday payloads uploaded to Loop",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--project-uploads",
+        help="strip values that carry no data out of Workday payloads before uploading them to Loop",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--daemon",
+        help="keep running, syncing whatever Loop requests as it is requested",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        help="the number of seconds between checks for what Loop has requested, with --daemon",
+        type=int,
+        default=60,
+    )
+    parser.add_argument(
+        "--search-interval",
+        help="the number of seconds between searches for expense reports, with --daemon",
+        type=int,
+        default=3600,
+    )
+    parser.add_argument(
+        "--keepalive-interval",
+        help="the number of seconds between requests to keep the Workday session alive, with --daemon",
+        type=int,
+        default=300,
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="the path to write a JSON summary of the run's timings and requests to",
+        required=False,
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        help="the path to write the run's metrics to in the Prometheus text format",
+        required=False,
+    )
+    args = parser.parse_args()
+
+    if args.session_cache is not None and args.session_cache_key is None:
+        parser.error("--session-cache-key is required with --session-cache")
+
+    if args.resume and args.journal is None:
+        parser.error("--journal is required with --resume")
+
+    try:
+        with METRICS.phase("run"):
+            upload(args)
+    finally:
+        print(dumps(METRICS.summary()))
+        write_metrics(args)
@@ -0,0 +1,371 @@
+"""
+HTTP clients for Workday and Loop, with concurrency and rate limits and retries
+"""
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from gzip import compress as gzip_compress
+from json import JSONDecodeError, dumps, loads
+from random import uniform
+from threading import Condition, Lock
+from time import monotonic, sleep
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, RequestException, Timeout
+
+from loop_workday_upload.metrics import METRICS
+from loop_workday_upload.widgets import project_widgets
+
+WORKDAY_BASE_URL = "https://wd5.myworkday.com"
+
+
+# Connect and read timeouts, in seconds, for each kind of request, which also have their latency tracked separately
+TIMEOUTS: Dict[str, Tuple[int, int]] = {
+    "workday": (5, 5),
+    "workday-search-results": (5, 60),
+    "loop": (5, 5),
+    "loop-search-results": (5, 60),
+    "loop-attachment": (5, 10),
+}
+
+
+# Base and maximum delays, in seconds, between retries of failed requests
+RETRY_BACKOFF_BASE = 0.5
+
+
+MAX_RETRY_DELAY = 60.0
+
+
+# How many times slower than recent requests a response can be before the host is considered to be struggling
+LATENCY_SPIKE_FACTOR = 3
+
+
+# Workday payloads are forwarded to Loop as the bytes Workday sent, rather than parsed and serialized again
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+# gzip level for uploads to Loop, trading a little size for much less CPU time than the maximum level
+UPLOAD_COMPRESSION_LEVEL = 6
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """
+    Thread-safe token bucket, limiting the average rate of requests to a host while allowing short bursts
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def acquire(self) -> None:
+        """
+        Take a token from the bucket, waiting for one to become available if necessary
+        """
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Limits concurrent requests to a host, adjusting the limit AIMD-style: it grows by about one for each round of
+    healthy responses, and halves when the host throttles, fails, or slows down compared to the same kind of request
+    """
+
+    def __init__(self, maximum: int) -> None:
+        self.maximum = maximum
+        self.limit = float(max(1, maximum // 2))
+        self.in_flight = 0
+        self.latencies: Dict[str, float] = {}
+        self.condition = Condition()
+
+    def acquire(self) -> None:
+        """
+        Wait until there is room for another request under the current limit
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    def release(self, endpoint: str, latency: float, healthy: bool) -> None:
+        """
+        Record the outcome of a request of the given kind and adjust the limit accordingly
+        """
+        with self.condition:
+            self.in_flight -= 1
+
+            # Attachments and search results are always slower than other requests, so they are only compared to their
+            # own kind, or every one of them would look like the host slowing down
+            average = self.latencies.get(endpoint)
+            spike = average is not None and latency > max(LATENCY_SPIKE_FACTOR * average, 1)
+
+            if not healthy or spike:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+
+            self.latencies[endpoint] = latency if average is None else 0.8 * average + 0.2 * latency
+            self.condition.notify_all()
+
+
+def get_retry_after(response: Response) -> Optional[float]:
+    """
+    Get the number of seconds a response asked the client to wait before retrying, if any
+    """
+    value = response.headers.get("Retry-After")
+
+    if value is None:
+        return None
+
+    try:
+        return min(MAX_RETRY_DELAY, max(0.0, float(value)))
+    except ValueError:
+        pass
+
+    try:
+        delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+    return min(MAX_RETRY_DELAY, max(0.0, delay))
+
+
+def get_retry_delay(attempt: int, response: Optional[Response] = None) -> float:
+    """
+    Get how long to wait before retrying a request, using jittered exponential backoff unless the response said
+    """
+    retry_after = None if response is None else get_retry_after(response)
+
+    if retry_after is not None:
+        return retry_after
+
+    return uniform(0, min(MAX_RETRY_DELAY, RETRY_BACKOFF_BASE * 2**attempt))
+
+
+class Client:  # pylint: disable=too-many-instance-attributes
+    """
+    Persistent, pooled HTTP session for a single host
+    """
+
+    # Requests with these methods can be sent again after a timeout or server error without side effects
+    idempotent_methods = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+    def __init__(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+        self,
+        name: str,
+        base_url: str,
+        concurrency: int,
+        timeout: Tuple[int, int],
+        rate_limiter: Optional[TokenBucket] = None,
+        retries: int = 0,
+    ) -> None:
+        self.name = name
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.limiter = AdaptiveLimiter(concurrency)
+        self.session = Session()
+
+        # Keep one connection open per concurrent request, so connections are reused rather than re-established
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        endpoint: Optional[str] = None,
+        idempotent: Optional[bool] = None,
+        **kwargs: Any,
+    ) -> Response:
+        """
+        Send a request to this host, waiting for a free slot if the concurrency limit has been reached, and retrying
+        with backoff if the host is throttling or the request failed in a way that is safe to retry
+
+        The endpoint is the kind of request from TIMEOUTS, if it isn't the default for this host. Whether the request
+        is idempotent defaults to whether its method is, for requests that differ from the rest of their method.
+        """
+        endpoint = self.name if endpoint is None else endpoint
+
+        # A streamed body can only be sent once
+        replayable = not isinstance(kwargs.get("data"), Iterator)
+        idempotent = replayable and (method in self.idempotent_methods if idempotent is None else idempotent)
+        attempt = 0
+
+        while True:
+            self.limiter.acquire()
+            start = monotonic()
+
+            try:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+
+                response = self.session.request(
+                    method,
+                    f"{self.base_url}{path}",
+                    timeout=self.timeout if endpoint == self.name else TIMEOUTS[endpoint],
+                    **kwargs,
+                )
+            except (RequestsConnectionError, Timeout) as e:
+                self.limiter.release(endpoint, monotonic() - start, healthy=False)
+
+                if not idempotent or attempt >= self.retries:
+                    raise
+
+                print(f"{method} {path} failed: {e!r}")
+                delay = get_retry_delay(attempt)
+            else:
+                latency = monotonic() - start
+                throttled = response.status_code in (429, 503)
+                self.limiter.release(endpoint, latency, healthy=not throttled)
+
+                # Streamed bodies are counted as they are read, since reading them here would defeat the purpose
+                METRICS.record_request(
+                    self.name,
+                    latency,
+                    len(response.request.body) if isinstance(response.request.body, (bytes, str)) else 0,
+                    0 if kwargs.get("stream", False) else len(response.content),
+                )
+
+                # Throttled requests weren't processed, so they're safe to retry even if they aren't idempotent
+                retryable = (throttled and replayable) or (response.status_code in (502, 504) and idempotent)
+
+                if not retryable or attempt >= self.retries:
+                    return response
+
+                print(f"{method} {path} returned {response.status_code}")
+                delay = get_retry_delay(attempt, response)
+                response.close()
+
+            attempt += 1
+            METRICS.record_retry(self.name)
+            print(f"Retrying {method} {path} in {delay:.1f} seconds (attempt {attempt + 1} of {self.retries + 1})")
+            sleep(delay)
+
+    def get(self, path: str, **kwargs: Any) -> Response:
+        """
+        Send a GET request to this host
+        """
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs: Any) -> Response:
+        """
+        Send a POST request to this host
+        """
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs: Any) -> Response:
+        """
+        Send a PUT request to this host
+        """
+        return self.request("PUT", path, **kwargs)
+
+
+class WorkdayClient(Client):
+    """
+    Session for Workday, authenticated with cookies from the browser
+    """
+
+    # The POST requests this script makes to Workday only retrieve data, except for submitting forms, which pass
+    # idempotent=False
+    idempotent_methods = Client.idempotent_methods | {"POST"}
+
+    def __init__(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+        self,
+        cookies: Dict[str, str],
+        concurrency: int,
+        rate_limit: Optional[float] = None,
+        retries: int = 0,
+        base_url: str = WORKDAY_BASE_URL,
+    ) -> None:
+        super().__init__(
+            "workday",
+            base_url,
+            concurrency,
+            TIMEOUTS["workday"],
+            None if rate_limit is None else TokenBucket(rate_limit, concurrency),
+            retries,
+        )
+        self.session.cookies.update(cookies)
+
+    def is_logged_in(self) -> bool:
+        """
+        Check whether the session is still authenticated, without following the redirect to CAS if it isn't
+        """
+        try:
+            response = self.get("/gatech/d/home.htmld", allow_redirects=False)
+        except RequestException:
+            return False
+
+        if response.status_code != 200:
+            return False
+
+        try:
+            response.json()
+        except JSONDecodeError:
+            return False
+
+        return True
+
+
+class LoopClient(Client):
+    """
+    Session for Loop, authenticated with a bearer token
+    """
+
+    def __init__(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+        self,
+        server: str,
+        token: str,
+        concurrency: int,
+        retries: int = 0,
+        compress: bool = False,
+        project: bool = False,
+    ) -> None:
+        super().__init__("loop", server, concurrency, TIMEOUTS["loop"], retries=retries)
+        self.compress = compress
+        self.project = project
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/json",
+            }
+        )
+
+    def upload(self, method: str, path: str, payload: bytes, widgets: Any = None, **kwargs: Any) -> Response:
+        """
+        Send a Workday payload to Loop, projecting and compressing it first if enabled
+        """
+        body = payload
+        headers = dict(JSON_HEADERS)
+
+        if self.project:
+            projected, _ = project_widgets(loads(payload) if widgets is None else widgets)
+            body = dumps(projected, separators=(",", ":")).encode()
+
+        if self.compress:
+            body = gzip_compress(body, compresslevel=UPLOAD_COMPRESSION_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+
+        if body is not payload:
+            print(f"Reduced upload to {path} from {len(payload)} to {len(body)} bytes")
+
+        return self.request(method, path, data=body, headers=headers, **kwargs)
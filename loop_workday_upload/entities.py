@@ -0,0 +1,422 @@
+"""
+Syncing individual entities from Workday to Loop
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from json import dumps
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from requests import Response
+
+from urllib3.fields import RequestField
+from urllib3.filepost import choose_boundary
+
+from loop_workday_upload.metrics import METRICS, timed
+from loop_workday_upload.state import SyncContext, hash_payload
+from loop_workday_upload.widgets import WidgetIndex
+
+# Number of bytes to read from Workday at a time when streaming attachments to Loop
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+
+
+def count_transferred_bytes(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Pass through chunks of an attachment, recording them as received from Workday and sent to Loop
+    """
+    for chunk in chunks:
+        METRICS.record_transfer("workday", received=len(chunk))
+        METRICS.record_transfer("loop", sent=len(chunk))
+        yield chunk
+
+
+def stream_multipart_upload(boundary: str, name: str, filename: str, content: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Encode a single file as multipart/form-data, passing its content through in chunks as they are read
+    """
+    field = RequestField(name=name, data=b"", filename=filename)
+    field.make_multipart()
+
+    yield f"--{boundary}\r\n{field.render_headers()}".encode()
+
+    for chunk in content:
+        # An empty chunk would end a chunked upload early
+        if len(chunk) > 0:
+            yield chunk
+
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+@timed("download-attachment")
+def download_attachment(context: SyncContext, attachment: str, widget: Mapping[str, Any]) -> Response:
+    """
+    Start downloading a single attachment from Workday, returning the response for its content to be streamed from
+    """
+    print(f"Downloading attachment {attachment} from Workday")
+
+    workday_attachment_response = context.workday.get(
+        f"/gatech/attachment/1074${attachment}/{widget['target']}.htmld", stream=True
+    )
+
+    if workday_attachment_response.status_code != 200:
+        print(workday_attachment_response.status_code)
+        print(workday_attachment_response.text)
+        workday_attachment_response.close()
+        raise ValueError("Unexpected response code from Workday")
+
+    return workday_attachment_response
+
+
+@timed("upload-attachment")
+def upload_attachment(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+    context: SyncContext,
+    instance_id: str,
+    line_id: str,
+    attachment: str,
+    widget: Mapping[str, Any],
+    workday_attachment_response: Response,
+) -> None:
+    """
+    Stream a single attachment to Loop as it is downloaded from Workday, without holding the whole file in memory
+    """
+    print(f"Uploading attachment {attachment} to Loop")
+
+    boundary = choose_boundary()
+
+    loop_attachment_response = context.loop.post(
+        f"/api/v1/workday/expense-reports/{instance_id}/lines/{line_id}/attachments/{attachment}",
+        data=stream_multipart_upload(
+            boundary,
+            "attachment",
+            widget["text"],
+            count_transferred_bytes(workday_attachment_response.iter_content(chunk_size=ATTACHMENT_CHUNK_SIZE)),
+        ),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        endpoint="loop-attachment",
+    )
+
+    if loop_attachment_response.status_code != 200:
+        print(loop_attachment_response.status_code)
+        print(loop_attachment_response.text)
+        raise ValueError("Unexpected response code from Loop")
+
+    context.complete("attachment", f"{instance_id}/{line_id}/{attachment}")
+
+
+@timed("transfer-attachment")
+def transfer_attachment(
+    context: SyncContext, instance_id: str, line_id: str, attachment: str, widget: Mapping[str, Any]
+) -> None:
+    """
+    Stream a single attachment from Workday to Loop
+    """
+    if context.is_completed("attachment", f"{instance_id}/{line_id}/{attachment}"):
+        print(f"Attachment {attachment} was already synced in this run, skipping")
+        return
+
+    with download_attachment(context, attachment, widget) as workday_attachment_response:
+        upload_attachment(context, instance_id, line_id, attachment, widget, workday_attachment_response)
+
+
+class UploadedLine(NamedTuple):
+    """
+    An expense report line uploaded to Loop, with the attachments it still needs
+    """
+
+    workday_hash: str
+    loop_response: str
+    attachments: List[Tuple[str, Mapping[str, Any]]]
+
+
+@timed("fetch-expense-report-line")
+def fetch_expense_report_line(context: SyncContext, get_line_url: str, instance_id: str, line_id: str) -> Response:
+    """
+    Retrieve a single expense report line from Workday
+    """
+    print(f"Retrieving expense report line {line_id} for expense report {instance_id} from Workday")
+    workday_response = context.workday.post(f"{get_line_url}.htmld", data={"id": line_id})
+
+    if workday_response.status_code != 200:
+        print(workday_response.status_code)
+        print(workday_response.text)
+        raise ValueError("Unexpected response code from Workday")
+
+    return workday_response
+
+
+@timed("upload-expense-report-line")
+def upload_expense_report_line(
+    context: SyncContext, instance_id: str, line_id: str, workday_response: Response
+) -> Optional[UploadedLine]:
+    """
+    Upload a single expense report line to Loop, returning the attachments to transfer, or None if it is unchanged
+    """
+    workday_hash = hash_payload(workday_response.content)
+
+    if context.is_unchanged("expense-report-line", f"{instance_id}/{line_id}", workday_hash):
+        print(f"Expense report line {line_id} for expense report {instance_id} is unchanged, skipping upload")
+        return None
+
+    print(f"Uploading expense report line {line_id} for expense report {instance_id} to Loop")
+
+    # Projecting needs the parsed payload anyway, so it is parsed once and shared with the attachment lookup
+    tree = workday_response.json() if context.loop.project else None
+
+    loop_response = context.loop.upload(
+        "PUT", f"/api/v1/workday/expense-reports/{instance_id}/lines/{line_id}", workday_response.content, tree
+    )
+
+    if loop_response.status_code != 200:
+        print(workday_response.text)
+        print(loop_response.status_code)
+        print(loop_response.text)
+        raise ValueError("Unexpected response code from Loop")
+
+    print(loop_response.status_code)
+    print(loop_response.text)
+
+    attachment_ids = loop_response.json()["attachments"]
+    attachments = []
+
+    # Only parse the Workday payload if there are attachments to look up in it and it wasn't parsed for projecting
+    if len(attachment_ids) > 0:
+        widgets = WidgetIndex(workday_response.json() if tree is None else tree)
+
+        for attachment in attachment_ids:
+            values = widgets.find("instanceId", f"1074${attachment}")
+
+            if len(values) != 1:
+                print(workday_response.text)
+                print(dumps(values))
+                raise ValueError("Did not find exactly one widget")
+
+            attachments.append((attachment, values[0]))
+
+    return UploadedLine(workday_hash, loop_response.text, attachments)
+
+
+def finish_expense_report_line(
+    context: SyncContext, instance_id: str, line_id: str, uploaded: Optional[UploadedLine]
+) -> None:
+    """
+    Record that an expense report line and all its attachments are in Loop
+    """
+    # Only remember the line once all its attachments are in Loop, so a failed transfer is retried next run
+    if uploaded is not None:
+        context.remember(
+            "expense-report-line", f"{instance_id}/{line_id}", uploaded.workday_hash, uploaded.loop_response
+        )
+
+    context.complete("expense-report-line", f"{instance_id}/{line_id}")
+
+
+@timed("sync-expense-report-line")
+def sync_expense_report_line(context: SyncContext, get_line_url: str, instance_id: str, line_id: str) -> None:
+    """
+    Sync a single expense report line from Loop to Workday
+    """
+    if context.is_completed("expense-report-line", f"{instance_id}/{line_id}"):
+        print(
+            f"Expense report line {line_id} for expense report {instance_id} was already synced in this run, skipping"
+        )
+        return
+
+    workday_response = fetch_expense_report_line(context, get_line_url, instance_id, line_id)
+    uploaded = upload_expense_report_line(context, instance_id, line_id, workday_response)
+
+    if uploaded is not None:
+        with ThreadPoolExecutor(max_workers=context.attachment_concurrency) as executor:
+            futures = [
+                executor.submit(transfer_attachment, context, instance_id, line_id, attachment, widget)
+                for attachment, widget in uploaded.attachments
+            ]
+
+        for future in futures:
+            future.result()
+
+    finish_expense_report_line(context, instance_id, line_id, uploaded)
+
+
+@timed("fetch-expense-report")
+def fetch_expense_report(context: SyncContext, instance_id: str) -> Response:
+    """
+    Retrieve a single expense report from Workday
+    """
+    print(f"Retrieving expense report {instance_id} from Workday")
+    workday_response = context.workday.get(f"/gatech/inst/1$1356/1356${instance_id}.htmld")
+
+    if workday_response.status_code != 200:
+        print(workday_response.status_code)
+        print(workday_response.text)
+        raise ValueError("Unexpected response code from Workday")
+
+    return workday_response
+
+
+@timed("upload-expense-report")
+def upload_expense_report(context: SyncContext, instance_id: str, workday_response: Response) -> Tuple[str, List[str]]:
+    """
+    Upload a single expense report to Loop, returning the URL and IDs to retrieve its lines
+    """
+    workday_hash = hash_payload(workday_response.content)
+
+    widgets = WidgetIndex(workday_response.json())
+
+    # The lines are retrieved separately, so they still need to be checked even if the report itself is unchanged
+    if context.is_unchanged("expense-report", instance_id, workday_hash):
+        print(f"Expense report {instance_id} is unchanged, skipping upload")
+    else:
+        print(f"Uploading expense report {instance_id} to Loop")
+
+        loop_response = context.loop.upload(
+            "PUT", f"/api/v1/workday/expense-reports/{instance_id}", workday_response.content, widgets.widgets
+        )
+
+        if loop_response.status_code != 200:
+            print(workday_response.text)
+            print(loop_response.status_code)
+            print(loop_response.text)
+            raise ValueError("Unexpected response code from Loop")
+
+        context.remember("expense-report", instance_id, workday_hash, loop_response.text)
+
+    values = widgets.find("widget", "extensionActions")
+
+    if len(values) != 1:
+        print(workday_response.text)
+        print(dumps(values))
+        raise ValueError("Did not find exactly one widget")
+
+    get_line_url = values[0]["extensionActions"][0]["uri"]
+
+    values = widgets.find("label", "Expense Lines")
+
+    if len(values) != 1:
+        print(dumps(values))
+        raise ValueError("Did not find exactly one widget")
+
+    return get_line_url, [row["id"] for row in values[0]["rows"]]
+
+
+@timed("sync-expense-report")
+def sync_expense_report(context: SyncContext, instance_id: str) -> None:
+    """
+    Sync a single expense report and all of its lines from Workday to Loop
+    """
+    if context.is_completed("expense-report", instance_id):
+        print(f"Expense report {instance_id} was already synced in this run, skipping")
+        return
+
+    get_line_url, line_ids = upload_expense_report(context, instance_id, fetch_expense_report(context, instance_id))
+
+    failures = run_sync_tasks(
+        [
+            (
+                f"expense report line {line_id} for expense report {instance_id}",
+                partial(sync_expense_report_line, context, get_line_url, instance_id, line_id),
+            )
+            for line_id in line_ids
+        ],
+        context.line_concurrency,
+    )
+
+    if len(failures) > 0:
+        raise ValueError(f"Failed to sync {len(failures)} lines")
+
+    # The report is only complete once all its lines are, since resuming needs the report to find the rest
+    context.complete("expense-report", instance_id)
+
+
+@timed("sync-worker")
+def sync_worker(context: SyncContext, instance_id: str) -> None:
+    """
+    Sync a worker (user) from Workday to Loop
+    """
+    if context.is_completed("worker", instance_id):
+        print(f"Worker {instance_id} was already synced in this run, skipping")
+        return
+
+    print(f"Retrieving worker {instance_id} from Workday")
+    workday_response = context.workday.get(f"/gatech/inst/1$37/247${instance_id}.htmld")
+
+    if workday_response.status_code != 200:
+        print(workday_response.status_code)
+        print(workday_response.text)
+        raise ValueError("Unexpected response code from Workday")
+
+    workday_hash = hash_payload(workday_response.content)
+
+    if context.is_unchanged("worker", instance_id, workday_hash):
+        print(f"Worker {instance_id} is unchanged, skipping upload")
+        context.complete("worker", instance_id)
+        return
+
+    print(f"Uploading worker {instance_id} to Loop")
+
+    loop_response = context.loop.upload("POST", "/api/v1/workday/workers", workday_response.content)
+
+    if loop_response.status_code != 200:
+        print(workday_response.text)
+        print(loop_response.status_code)
+        print(loop_response.text)
+        raise ValueError("Unexpected response code from Loop")
+
+    context.remember("worker", instance_id, workday_hash, loop_response.text)
+    context.complete("worker", instance_id)
+
+
+@timed("sync-external-committee-member")
+def sync_external_committee_member(context: SyncContext, instance_id: str) -> None:
+    """
+    Sync an external committee member from Workday to Loop
+    """
+    if context.is_completed("external-committee-member", instance_id):
+        print(f"External committee member {instance_id} was already synced in this run, skipping")
+        return
+
+    print(f"Retrieving external committee member {instance_id} from Workday")
+    workday_response = context.workday.post(f"/gatech/inst/1$15341/15341${instance_id}.htmld", data={"preview": 1})
+
+    if workday_response.status_code != 200:
+        print(workday_response.status_code)
+        print(workday_response.text)
+        raise ValueError("Unexpected response code from Workday")
+
+    workday_hash = hash_payload(workday_response.content)
+
+    if context.is_unchanged("external-committee-member", instance_id, workday_hash):
+        print(f"External committee member {instance_id} is unchanged, skipping upload")
+        context.complete("external-committee-member", instance_id)
+        return
+
+    print(f"Uploading external committee member {instance_id} to Loop")
+
+    loop_response = context.loop.upload("POST", "/api/v1/workday/external-committee-members", workday_response.content)
+
+    if loop_response.status_code != 200:
+        print(workday_response.text)
+        print(loop_response.status_code)
+        print(loop_response.text)
+        raise ValueError("Unexpected response code from Loop")
+
+    context.remember("external-committee-member", instance_id, workday_hash, loop_response.text)
+    context.complete("external-committee-member", instance_id)
+
+
+def run_sync_tasks(tasks: List[Tuple[str, Callable[[], None]]], threads: int) -> List[Tuple[str, BaseException]]:
+    """
+    Run sync tasks on a bounded thread pool, returning any failures in the order the tasks were submitted
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [(description, executor.submit(task)) for description, task in tasks]
+
+    failures = []
+
+    for description, future in futures:
+        exception = future.exception()
+
+        if exception is not None:
+            print(f"Failed to sync {description}: {exception!r}")
+            failures.append((description, exception))
+
+    return failures
@@ -0,0 +1,178 @@
+"""
+Request and phase timing metrics
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+from os import replace
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+
+
+R = TypeVar("R")
+
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+class Metrics:  # pylint: disable=too-many-instance-attributes
+    """
+    Thread-safe record of how long each phase of a run took, and of the requests made to each host
+    """
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.phase_counts: Dict[str, int] = {}
+        self.phase_totals: Dict[str, float] = {}
+        self.phase_maximums: Dict[str, float] = {}
+        self.latency_buckets: Dict[str, List[int]] = {}
+        self.latency_sums: Dict[str, float] = {}
+        self.requests: Dict[str, int] = {}
+        self.retries: Dict[str, int] = {}
+        self.bytes_sent: Dict[str, int] = {}
+        self.bytes_received: Dict[str, int] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time a phase of the run, such as logging in or syncing a single entity
+        """
+        start = monotonic()
+
+        try:
+            yield
+        finally:
+            duration = monotonic() - start
+
+            # Only aggregates are kept, so a long-running daemon doesn't accumulate a duration for every phase
+            with self.lock:
+                self.phase_counts[name] = self.phase_counts.get(name, 0) + 1
+                self.phase_totals[name] = self.phase_totals.get(name, 0.0) + duration
+                self.phase_maximums[name] = max(self.phase_maximums.get(name, 0.0), duration)
+
+    def record_request(self, host: str, latency: float, sent: int, received: int) -> None:
+        """
+        Record a completed request to a host
+        """
+        with self.lock:
+            buckets = self.latency_buckets.setdefault(host, [0] * len(LATENCY_BUCKETS))
+
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    buckets[index] += 1
+
+            self.latency_sums[host] = self.latency_sums.get(host, 0.0) + latency
+            self.requests[host] = self.requests.get(host, 0) + 1
+            self.bytes_sent[host] = self.bytes_sent.get(host, 0) + sent
+            self.bytes_received[host] = self.bytes_received.get(host, 0) + received
+
+    def record_transfer(self, host: str, sent: int = 0, received: int = 0) -> None:
+        """
+        Record bytes streamed to or from a host after the request itself was recorded
+        """
+        with self.lock:
+            self.bytes_sent[host] = self.bytes_sent.get(host, 0) + sent
+            self.bytes_received[host] = self.bytes_received.get(host, 0) + received
+
+    def record_retry(self, host: str) -> None:
+        """
+        Record a retried request to a host
+        """
+        with self.lock:
+            self.retries[host] = self.retries.get(host, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the run as JSON-serializable data
+        """
+        with self.lock:
+            return {
+                "phases": {
+                    name: {
+                        "count": count,
+                        "total_seconds": self.phase_totals[name],
+                        "max_seconds": self.phase_maximums[name],
+                    }
+                    for name, count in self.phase_counts.items()
+                },
+                "hosts": {
+                    host: {
+                        "requests": requests,
+                        "retries": self.retries.get(host, 0),
+                        "bytes_sent": self.bytes_sent.get(host, 0),
+                        "bytes_received": self.bytes_received.get(host, 0),
+                        "latency_seconds_total": self.latency_sums[host],
+                        "latency_seconds_buckets": {
+                            str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets[host])
+                        },
+                    }
+                    for host, requests in self.requests.items()
+                },
+            }
+
+    def write_prometheus_textfile(self, path: str) -> None:
+        """
+        Write the run's metrics in the Prometheus text format, for the node exporter's textfile collector
+        """
+        summary = self.summary()
+        lines = [
+            "# HELP loop_workday_upload_phase_seconds Time spent in each phase of the last run",
+            "# TYPE loop_workday_upload_phase_seconds summary",
+        ]
+
+        for name, phase in summary["phases"].items():
+            lines.append(f'loop_workday_upload_phase_seconds_sum{{phase="{name}"}} {phase["total_seconds"]}')
+            lines.append(f'loop_workday_upload_phase_seconds_count{{phase="{name}"}} {phase["count"]}')
+
+        lines.append("# HELP loop_workday_upload_request_duration_seconds Latency of requests to each host")
+        lines.append("# TYPE loop_workday_upload_request_duration_seconds histogram")
+
+        for host, stats in summary["hosts"].items():
+            for bound, count in stats["latency_seconds_buckets"].items():
+                le = "+Inf" if bound == "inf" else bound
+                lines.append(f'loop_workday_upload_request_duration_seconds_bucket{{host="{host}",le="{le}"}} {count}')
+
+            lines.append(
+                f'loop_workday_upload_request_duration_seconds_sum{{host="{host}"}} {stats["latency_seconds_total"]}'
+            )
+            lines.append(f'loop_workday_upload_request_duration_seconds_count{{host="{host}"}} {stats["requests"]}')
+
+        for metric, key, description in (
+            ("retries_total", "retries", "Requests retried"),
+            ("bytes_sent_total", "bytes_sent", "Bytes sent"),
+            ("bytes_received_total", "bytes_received", "Bytes received"),
+        ):
+            lines.append(f"# HELP loop_workday_upload_{metric} {description} to each host")
+            lines.append(f"# TYPE loop_workday_upload_{metric} counter")
+
+            for host, stats in summary["hosts"].items():
+                lines.append(f'loop_workday_upload_{metric}{{host="{host}"}} {stats[key]}')
+
+        # Write to a temporary file and rename it, so the collector never reads a partial file
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+        replace(f"{path}.tmp", path)
+
+
+METRICS = Metrics()
+
+
+def timed(name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """
+    Record how long each call to the decorated function takes as a phase of the run
+    """
+
+    def decorator(function: Callable[P, R]) -> Callable[P, R]:
+        @wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            with METRICS.phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
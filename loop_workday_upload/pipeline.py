@@ -0,0 +1,292 @@
+"""
+Staged pipeline for syncing expense reports, their lines, and their attachments
+"""
+
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from queue import Queue
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from requests import Response
+
+from loop_workday_upload.entities import (
+    UploadedLine,
+    download_attachment,
+    fetch_expense_report,
+    fetch_expense_report_line,
+    finish_expense_report_line,
+    upload_attachment,
+    upload_expense_report,
+    upload_expense_report_line,
+)
+from loop_workday_upload.state import SyncContext
+
+# Default number of workers for each stage of the expense report pipeline, in the order items flow through them
+PIPELINE_STAGE_WORKERS = {
+    "fetch-expense-report": 2,
+    "upload-expense-report": 2,
+    "fetch-expense-report-line": 4,
+    "upload-expense-report-line": 4,
+    "download-attachment": 2,
+    "upload-attachment": 2,
+}
+
+
+class PipelineSettings(NamedTuple):
+    """
+    Number of workers for each stage of the expense report pipeline, and how many items can wait between stages
+    """
+
+    workers: Mapping[str, int]
+    queue_size: int
+
+
+def parse_stage_workers(value: str) -> Tuple[str, int]:
+    """
+    Parse a STAGE=COUNT argument setting the number of workers for a stage of the expense report pipeline
+    """
+    stage, _, count = value.partition("=")
+
+    if stage not in PIPELINE_STAGE_WORKERS or not count.isdigit() or int(count) < 1:
+        raise ArgumentTypeError(f"expected STAGE=COUNT, with STAGE one of {', '.join(PIPELINE_STAGE_WORKERS)}")
+
+    return stage, int(count)
+
+
+def add_pipeline_arguments(parser: ArgumentParser) -> None:
+    """
+    Add the arguments that configure the expense report pipeline to a parser
+    """
+    parser.add_argument(
+        "--pipeline",
+        help="sync expense reports, lines, and attachments through a pipeline of stages with their own workers",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stage-workers",
+        help=f"the number of workers for a pipeline stage, one of {', '.join(PIPELINE_STAGE_WORKERS)}",
+        type=parse_stage_workers,
+        action="append",
+        default=[],
+        metavar="STAGE=COUNT",
+    )
+    parser.add_argument(
+        "--pipeline-queue-size",
+        help="the number of items that can wait between pipeline stages",
+        type=int,
+        default=8,
+    )
+
+
+def get_pipeline_settings(args: Namespace) -> Optional[PipelineSettings]:
+    """
+    Build the expense report pipeline settings from parsed arguments, or None if the pipeline isn't enabled
+    """
+    if not args.pipeline:
+        return None
+
+    return PipelineSettings({**PIPELINE_STAGE_WORKERS, **dict(args.stage_workers)}, args.pipeline_queue_size)
+
+
+class ExpenseReportPipeline:
+    """
+    Sync expense reports through stages of workers connected by bounded queues, so each line and attachment starts as
+    soon as its parent is uploaded, and fetching from Workday overlaps with uploading to Loop
+    """
+
+    def __init__(self, context: SyncContext, settings: PipelineSettings) -> None:
+        self.context = context
+        self.settings = settings
+        self.lock = Lock()
+
+        # Children still to finish for each expense report and line, before it can be recorded as complete
+        self.pending: Dict[Tuple[str, ...], int] = {}
+        self.uploaded_lines: Dict[Tuple[str, str], Optional[UploadedLine]] = {}
+        self.failures: Dict[str, BaseException] = {}
+
+    def run(self, instance_ids: List[str]) -> List[Tuple[str, BaseException]]:
+        """
+        Sync expense reports through the pipeline, returning any that failed in the order they were given
+        """
+        stages: List[Tuple[str, Callable[..., List[Tuple[Any, ...]]]]] = [
+            ("fetch-expense-report", self.fetch_report),
+            ("upload-expense-report", self.upload_report),
+            ("fetch-expense-report-line", self.fetch_line),
+            ("upload-expense-report-line", self.upload_line),
+            ("download-attachment", self.download_attachment),
+            ("upload-attachment", self.upload_attachment),
+        ]
+        queues: List["Queue[Optional[Tuple[Any, ...]]]"] = [Queue(self.settings.queue_size) for _ in stages]
+        workers = [self.settings.workers[name] for name, _ in stages]
+        running = list(workers)
+        threads = [
+            Thread(target=self.work, args=(stage, handler, queues, workers, running), name=name)
+            for stage, (name, handler) in enumerate(stages)
+            for _ in range(workers[stage])
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for instance_id in instance_ids:
+            if self.context.is_completed("expense-report", instance_id):
+                print(f"Expense report {instance_id} was already synced in this run, skipping")
+            else:
+                queues[0].put((instance_id,))
+
+        for _ in range(workers[0]):
+            queues[0].put(None)
+
+        for thread in threads:
+            thread.join()
+
+        return [
+            (f"expense report {instance_id}", self.failures[instance_id])
+            for instance_id in instance_ids
+            if instance_id in self.failures
+        ]
+
+    def work(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+        self,
+        stage: int,
+        handler: Callable[..., List[Tuple[Any, ...]]],
+        queues: List["Queue[Optional[Tuple[Any, ...]]]"],
+        workers: List[int],
+        running: List[int],
+    ) -> None:
+        """
+        Handle items from one stage's queue, passing what they produce on to the next, until the stage is finished
+        """
+        while (item := queues[stage].get()) is not None:
+            try:
+                results = handler(*item)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"Failed to sync expense report {item[0]}: {e!r}")
+
+                with self.lock:
+                    self.failures.setdefault(item[0], e)
+
+                continue
+
+            for result in results:
+                queues[stage + 1].put(result)
+
+        with self.lock:
+            running[stage] -= 1
+            finished = running[stage] == 0
+
+        # The last worker to finish tells the next stage that nothing more is coming
+        if finished and stage + 1 < len(queues):
+            for _ in range(workers[stage + 1]):
+                queues[stage + 1].put(None)
+
+    def expect(self, key: Tuple[str, ...], children: int) -> None:
+        """
+        Record how many children an expense report or line has left to sync
+        """
+        with self.lock:
+            self.pending[key] = children
+
+        if children == 0:
+            self.finish(key)
+
+    def done(self, key: Tuple[str, ...]) -> None:
+        """
+        Record that one child of an expense report or line has finished syncing
+        """
+        with self.lock:
+            self.pending[key] -= 1
+            finished = self.pending[key] == 0
+
+        if finished:
+            self.finish(key)
+
+    def finish(self, key: Tuple[str, ...]) -> None:
+        """
+        Record that an expense report or line is complete, since all of its children have finished syncing
+        """
+        with self.lock:
+            del self.pending[key]
+
+        if key[0] == "expense-report-line":
+            _, instance_id, line_id = key
+
+            with self.lock:
+                uploaded = self.uploaded_lines.pop((instance_id, line_id))
+
+            finish_expense_report_line(self.context, instance_id, line_id, uploaded)
+            self.done(("expense-report", instance_id))
+        else:
+            self.context.complete("expense-report", key[1])
+
+    def fetch_report(self, instance_id: str) -> List[Tuple[Any, ...]]:
+        """
+        Retrieve an expense report from Workday
+        """
+        return [(instance_id, fetch_expense_report(self.context, instance_id))]
+
+    def upload_report(self, instance_id: str, workday_response: Response) -> List[Tuple[Any, ...]]:
+        """
+        Upload an expense report to Loop, passing on the lines that still need to be synced
+        """
+        get_line_url, line_ids = upload_expense_report(self.context, instance_id, workday_response)
+        lines = []
+
+        for line_id in line_ids:
+            if self.context.is_completed("expense-report-line", f"{instance_id}/{line_id}"):
+                print(f"Expense report line {line_id} for expense report {instance_id} was already synced, skipping")
+            else:
+                lines.append((instance_id, get_line_url, line_id))
+
+        self.expect(("expense-report", instance_id), len(lines))
+        return lines
+
+    def fetch_line(self, instance_id: str, get_line_url: str, line_id: str) -> List[Tuple[Any, ...]]:
+        """
+        Retrieve an expense report line from Workday
+        """
+        return [(instance_id, line_id, fetch_expense_report_line(self.context, get_line_url, instance_id, line_id))]
+
+    def upload_line(self, instance_id: str, line_id: str, workday_response: Response) -> List[Tuple[Any, ...]]:
+        """
+        Upload an expense report line to Loop, passing on the attachments that still need to be transferred
+        """
+        uploaded = upload_expense_report_line(self.context, instance_id, line_id, workday_response)
+        attachments = []
+
+        for attachment, widget in [] if uploaded is None else uploaded.attachments:
+            if self.context.is_completed("attachment", f"{instance_id}/{line_id}/{attachment}"):
+                print(f"Attachment {attachment} was already synced in this run, skipping")
+            else:
+                attachments.append((instance_id, line_id, attachment, widget))
+
+        with self.lock:
+            self.uploaded_lines[(instance_id, line_id)] = uploaded
+
+        self.expect(("expense-report-line", instance_id, line_id), len(attachments))
+        return attachments
+
+    def download_attachment(
+        self, instance_id: str, line_id: str, attachment: str, widget: Mapping[str, Any]
+    ) -> List[Tuple[Any, ...]]:
+        """
+        Start downloading an attachment from Workday, passing on the response to stream it from
+        """
+        return [(instance_id, line_id, attachment, widget, download_attachment(self.context, attachment, widget))]
+
+    def upload_attachment(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+        self,
+        instance_id: str,
+        line_id: str,
+        attachment: str,
+        widget: Mapping[str, Any],
+        workday_attachment_response: Response,
+    ) -> List[Tuple[Any, ...]]:
+        """
+        Stream an attachment to Loop as it is downloaded from Workday
+        """
+        with workday_attachment_response:
+            upload_attachment(self.context, instance_id, line_id, attachment, widget, workday_attachment_response)
+
+        self.done(("expense-report-line", instance_id, line_id))
+        return []
@@ -0,0 +1,247 @@
+"""
+Searching Workday for expense reports and retrieving the results over HTTP, without a browser
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from functools import partial
+from json import loads
+from typing import Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from requests import Response
+from requests.exceptions import RequestException
+
+from loop_workday_upload.client import WorkdayClient
+from loop_workday_upload.metrics import timed
+from loop_workday_upload.widgets import find_chunking_url, find_first_value
+
+
+class SearchPrompts(NamedTuple):
+    """
+    Values for the prompts on the Find Expense Reports by Organization search, as Workday instance IDs
+    """
+
+    companies: Tuple[str, ...]
+    cost_centers: Tuple[str, ...]
+    worktags: Tuple[str, ...]
+    report_date_on_or_after: date
+    payee_types: Tuple[str, ...]
+
+
+# Prompts that take several values, so a search profile can be split into one search per value
+SPLITTABLE_SEARCH_PROMPTS = ("companies", "cost_centers", "worktags", "payee_types")
+
+
+# Everything a search profile can set, so a misspelled prompt is an error rather than silently running the default
+SEARCH_PROFILE_KEYS = frozenset({"name", "split_by", "report_date_on_or_after", *SPLITTABLE_SEARCH_PROMPTS})
+
+
+# The same values that search_for_expense_reports enters into the form
+DEFAULT_SEARCH_PROMPTS = SearchPrompts(
+    companies=("2501$1",),
+    cost_centers=("2502$367", "2502$180"),
+    worktags=("2506$9979", "2506$38743", "8261$1948", "8261$7425", "15341$7955", "15341$1787"),
+    report_date_on_or_after=date(2023, 1, 1),
+    payee_types=("9572$14",),
+)
+
+
+@timed("direct-search")
+def search_for_expense_reports_directly(workday: WorkdayClient, prompts: SearchPrompts) -> str:
+    """
+    Retrieve all relevant expense reports by submitting the search form over HTTP, without a browser
+    """
+    print("Retrieving expense report search form")
+    workday_response = workday.get("/gatech/d/task/1422$269.htmld")
+
+    if workday_response.status_code != 200:
+        print(workday_response.status_code)
+        print(workday_response.text)
+        raise ValueError("Unexpected response code from Workday")
+
+    form = workday_response.json()
+    flow_execution_key = find_first_value(form, "flowExecutionKey")
+    session_secure_token = find_first_value(form, "sessionSecureToken")
+
+    if flow_execution_key is None or session_secure_token is None:
+        raise ValueError("Could not find flowExecutionKey and sessionSecureToken in search form")
+
+    print("Submitting expense report search")
+    workday_response = workday.post(
+        "/gatech/flowController.htmld",
+        data={
+            "_flowExecutionKey": flow_execution_key,
+            "sessionSecureToken": session_secure_token,
+            "_eventId_submit": "uic_okButton",
+            "15$378585": prompts.companies,
+            "ExternalField146_7227PromptQualifier1": prompts.cost_centers,
+            "ExternalField146_4946PromptQualifier1": prompts.worktags,
+            "ExternalField146_13403PromptQualifier2": prompts.report_date_on_or_after.isoformat(),
+            "ExternalField3285_1140PromptQualifier1": prompts.payee_types,
+        },
+        endpoint="workday-search-results",
+        # Submitting the form advances the flow, so it isn't safe to send again if it may have been processed
+        idempotent=False,
+    )
+
+    if workday_response.status_code != 200:
+        print(workday_response.status_code)
+        print(workday_response.text)
+        raise ValueError("Unexpected response code from Workday")
+
+    chunking_url = find_chunking_url(workday_response.json())
+
+    if chunking_url is None:
+        raise ValueError("Could not find chunkingUrl")
+
+    print("Found chunking URL")
+    return chunking_url
+
+
+def check_search_profile(profile: Any) -> None:
+    """
+    Check that a search profile only sets known prompts, and that multi-valued prompts are lists of instance IDs
+    """
+    if not isinstance(profile, Mapping):
+        raise ValueError(f"Search profile {profile!r} is not an object")
+
+    unknown = sorted(set(profile) - SEARCH_PROFILE_KEYS)
+
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown keys in search profile {profile.get('name')}: {', '.join(unknown)}")
+
+    for prompt in SPLITTABLE_SEARCH_PROMPTS:
+        values = profile.get(prompt, [])
+
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise ValueError(f"{prompt} in search profile {profile.get('name')} is not a list of instance IDs")
+
+
+def load_search_profiles(path: str) -> List[SearchPrompts]:
+    """
+    Load search profiles from a JSON file, expanding any that are split into one search per value of a prompt
+    """
+    with open(path, encoding="utf-8") as file:
+        profiles = loads(file.read())
+
+    searches = []
+
+    for profile in profiles["profiles"]:
+        check_search_profile(profile)
+
+        # Prompts a profile doesn't mention keep the values the default search uses
+        overrides: Dict[str, Any] = {
+            prompt: tuple(profile[prompt]) for prompt in SPLITTABLE_SEARCH_PROMPTS if prompt in profile
+        }
+        prompts = DEFAULT_SEARCH_PROMPTS._replace(**overrides)
+
+        if "report_date_on_or_after" in profile:
+            prompts = prompts._replace(report_date_on_or_after=date.fromisoformat(profile["report_date_on_or_after"]))
+
+        split_by = profile.get("split_by")
+
+        if split_by is None:
+            searches.append(prompts)
+        elif split_by in SPLITTABLE_SEARCH_PROMPTS:
+            for value in getattr(prompts, split_by):
+                split: Dict[str, Any] = {split_by: (value,)}
+                searches.append(prompts._replace(**split))
+        else:
+            raise ValueError(f"Cannot split search profile {profile.get('name')} by {split_by}")
+
+    if len(searches) == 0:
+        raise ValueError(f"No search profiles in {path}")
+
+    # Identical searches would return identical results, so each is only run once
+    return list(dict.fromkeys(searches))
+
+
+def search_for_expense_reports_concurrently(workday: WorkdayClient, searches: List[SearchPrompts]) -> List[str]:
+    """
+    Run several expense report searches over HTTP at once, returning the URL to retrieve each one's results from
+    """
+    print(f"Running {len(searches)} expense report searches")
+
+    with ThreadPoolExecutor(max_workers=workday.concurrency) as executor:
+        chunking_urls = list(executor.map(partial(search_for_expense_reports_directly, workday), searches))
+
+    return list(dict.fromkeys(chunking_urls))
+
+
+def try_search_for_expense_reports_directly(workday: WorkdayClient, prompts: SearchPrompts) -> Optional[str]:
+    """
+    Search for expense reports over HTTP, returning None so the caller can fall back to the browser if it fails
+    """
+    try:
+        return search_for_expense_reports_directly(workday, prompts)
+    except (ValueError, RequestException) as e:
+        print(f"Direct search failed, falling back to the browser: {e!r}")
+        return None
+
+
+def count_search_result_rows(widgets: Any) -> int:
+    """
+    Count the rows in every grid within a page of Workday search results
+    """
+    count = 0
+    pending = [widgets]
+
+    while len(pending) > 0:
+        item = pending.pop()
+
+        if isinstance(item, Mapping):
+            if isinstance(item.get("rows"), list):
+                count += len(item["rows"])
+            else:
+                pending.extend(item.values())
+        elif isinstance(item, list):
+            pending.extend(item)
+
+    return count
+
+
+@timed("fetch-search-results-page")
+def get_search_result_page(  # pylint: disable=duplicate-code
+    workday: WorkdayClient, chunking_url: str, start_row: int, page_size: int
+) -> Response:
+    """
+    Retrieve a single page of expense report search results from Workday
+    """
+    print(f"Retrieving results {start_row} to {start_row + page_size - 1} from Workday - {chunking_url}")
+
+    workday_response = workday.post(
+        f"{chunking_url}.htmld",
+        data={"startRow": start_row, "maxRows": page_size},
+        endpoint="workday-search-results",
+    )
+
+    if workday_response.status_code != 200:
+        print(workday_response.status_code)
+        print(workday_response.text)
+        raise ValueError("Unexpected response code from Workday")
+
+    return workday_response
+
+
+def iter_search_result_pages(workday: WorkdayClient, chunking_url: str, page_size: int) -> Iterator[Response]:
+    """
+    Retrieve every page of expense report search results from Workday, fetching the next page in the background
+    while the caller handles the current one
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        start_row = 1
+        future: Optional[Future[Response]] = executor.submit(
+            get_search_result_page, workday, chunking_url, start_row, page_size
+        )
+
+        while future is not None:
+            page = future.result()
+
+            # A short page means there are no more results
+            if count_search_result_rows(page.json()) >= page_size:
+                start_row += page_size
+                future = executor.submit(get_search_result_page, workday, chunking_url, start_row, page_size)
+            else:
+                future = None
+
+            yield page
@@ -0,0 +1,280 @@
+"""
+State kept during and across sync runs, so work isn't repeated
+"""
+
+from copy import copy
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from json import JSONDecodeError, dumps, loads
+from os import SEEK_END, fsync
+from sqlite3 import connect
+from threading import Lock
+from time import time
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from loop_workday_upload.client import LoopClient, WorkdayClient
+
+
+class SyncCache:
+    """
+    Persistent record of what was last uploaded to Loop for each entity, so unchanged entities can be skipped
+    """
+
+    def __init__(self, path: str, max_age: timedelta) -> None:
+        self.connection = connect(path, check_same_thread=False)
+        self.lock = Lock()
+        self.max_age = max_age
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entities ("
+                "entity_type TEXT NOT NULL, "
+                "entity_id TEXT NOT NULL, "
+                "workday_hash TEXT NOT NULL, "
+                "loop_response TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "PRIMARY KEY (entity_type, entity_id))"
+            )
+            self.connection.execute("DELETE FROM entities WHERE updated_at < ?", (time() - max_age.total_seconds(),))
+
+    def get(self, entity_type: str, entity_id: str, workday_hash: str) -> Optional[str]:
+        """
+        Get the Loop response from the last upload of an entity, if its Workday payload hasn't changed since and the
+        upload isn't too old to trust
+        """
+        # Entries are only deleted on startup, so a daemon also has to ignore those that have aged out since
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT loop_response FROM entities "
+                "WHERE entity_type = ? AND entity_id = ? AND workday_hash = ? AND updated_at >= ?",
+                (entity_type, entity_id, workday_hash, time() - self.max_age.total_seconds()),
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def put(self, entity_type: str, entity_id: str, workday_hash: str, loop_response: str) -> None:
+        """
+        Record that an entity was uploaded to Loop
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?)",
+                (entity_type, entity_id, workday_hash, loop_response, time()),
+            )
+
+    def close(self) -> None:
+        """
+        Close the underlying database
+        """
+        with self.lock:
+            self.connection.close()
+
+
+def hash_payload(payload: bytes) -> str:
+    """
+    Hash a Workday payload exactly as it was received, so unchanged entities can be skipped without parsing them
+    """
+    return sha256(payload).hexdigest()
+
+
+class WorkRegistry:  # pylint: disable=too-few-public-methods
+    """
+    Record of the entities already synced during this run, so each is only synced once
+    """
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.claimed: Dict[str, Set[str]] = {}
+
+    def claim(self, entities: Mapping[str, Any]) -> Dict[str, List[str]]:
+        """
+        Mark entities requested by Loop as being synced, returning only those that weren't already synced in this run,
+        or that Loop has marked as stale since
+        """
+        stale = entities.get("stale", {})
+        unclaimed: Dict[str, List[str]] = {}
+
+        with self.lock:
+            for entity_type in ("workers", "external-committee-members", "expense-reports"):
+                claimed = self.claimed.setdefault(entity_type, set())
+                unclaimed[entity_type] = []
+
+                for entity_id in entities[entity_type]:
+                    if entity_id not in claimed or entity_id in stale.get(entity_type, []):
+                        claimed.add(entity_id)
+                        unclaimed[entity_type].append(entity_id)
+
+        return unclaimed
+
+
+class Journal:
+    """
+    Append-only record of the entities completed in each run, so an interrupted run can be resumed where it stopped
+    """
+
+    def __init__(self, path: str, resume: bool) -> None:
+        self.lock = Lock()
+        self.run = datetime.now(timezone.utc).isoformat()
+        self.completed: Set[Tuple[str, str]] = set()
+        contents = ""
+
+        if resume:
+            try:
+                with open(path, encoding="utf-8") as file:
+                    contents = file.read()
+            except FileNotFoundError:
+                pass
+
+        entries = []
+
+        for line in contents.splitlines():
+            try:
+                entries.append(loads(line))
+            except JSONDecodeError:
+                # The last entry is cut short if the previous run crashed while writing it
+                continue
+
+        # A run that finished cleanly ends with an entry saying so and has nothing left to resume, so a new run is
+        # started instead
+        if len(entries) > 0 and "finished" not in entries[-1]:
+            self.run = entries[-1]["run"]
+            self.completed = {
+                (entry["type"], entry["id"]) for entry in entries if entry["run"] == self.run and "type" in entry
+            }
+            print(f"Resuming run {self.run}, skipping {len(self.completed)} completed entities")
+
+        self.file = open(path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+
+        # Start on a new line, so the next entry isn't appended to one that was cut short, even if the journal that
+        # entry belongs to isn't being resumed
+        if self.file.tell() > 0:
+            with open(path, "rb") as file:
+                file.seek(-1, SEEK_END)
+                cut_short = file.read(1) != b"\n"
+
+            if cut_short:
+                self.file.write("\n")
+
+    def is_completed(self, entity_type: str, entity_id: str) -> bool:
+        """
+        Check whether an entity was completed earlier in this run
+        """
+        with self.lock:
+            return (entity_type, entity_id) in self.completed
+
+    def record(self, entity_type: str, entity_id: str) -> None:
+        """
+        Durably record that an entity was completed, before moving on to the next one
+        """
+        with self.lock:
+            self.completed.add((entity_type, entity_id))
+            self.write({"run": self.run, "type": entity_type, "id": entity_id})
+
+    def finish(self) -> None:
+        """
+        Durably record that the current run finished, so it isn't resumed
+        """
+        with self.lock:
+            self.write({"run": self.run, "finished": datetime.now(timezone.utc).isoformat()})
+
+    def write(self, entry: Dict[str, str]) -> None:
+        """
+        Append an entry and wait for it to reach the disk, with the lock held
+        """
+        self.file.write(dumps(entry) + "\n")
+        self.file.flush()
+        fsync(self.file.fileno())
+
+    def start_run(self) -> None:
+        """
+        Start recording a new run, so entities completed in earlier runs are synced again
+        """
+        with self.lock:
+            self.run = datetime.now(timezone.utc).isoformat()
+            self.completed = set()
+
+    def close(self) -> None:
+        """
+        Close the underlying file
+        """
+        with self.lock:
+            self.file.close()
+
+
+class SyncContext:  # pylint: disable=too-many-instance-attributes
+    """
+    Clients and settings shared by every sync task in a run
+    """
+
+    def __init__(  # pylint: disable=too-many-positional-arguments,too-many-arguments
+        self,
+        workday: WorkdayClient,
+        loop: LoopClient,
+        attachment_concurrency: int,
+        line_concurrency: int = 1,
+        cache: Optional[SyncCache] = None,
+        force: bool = False,
+        journal: Optional[Journal] = None,
+    ) -> None:
+        self.workday = workday
+        self.loop = loop
+        self.attachment_concurrency = attachment_concurrency
+        self.line_concurrency = line_concurrency
+        self.cache = cache
+        self.force = force
+        self.journal = journal
+        self.registry = WorkRegistry()
+
+    def start_run(self) -> None:
+        """
+        Start a new run, so entities synced earlier by this process are synced again if Loop requests them
+        """
+        self.registry = WorkRegistry()
+
+        if self.journal is not None:
+            self.journal.start_run()
+
+    def requested(self) -> "SyncContext":
+        """
+        Copy of this context for entities Loop explicitly requested, which are uploaded even if unchanged in the cache
+        """
+        context = copy(self)
+        context.force = True
+
+        return context
+
+    def is_completed(self, entity_type: str, entity_id: str) -> bool:
+        """
+        Check whether an entity was already completed in the run being resumed, if journaling is enabled
+        """
+        return self.journal is not None and self.journal.is_completed(entity_type, entity_id)
+
+    def complete(self, entity_type: str, entity_id: str) -> None:
+        """
+        Record that an entity is completely synced, if journaling is enabled
+        """
+        if self.journal is not None:
+            self.journal.record(entity_type, entity_id)
+
+    def finish(self) -> None:
+        """
+        Record that the run finished, if journaling is enabled
+        """
+        if self.journal is not None:
+            self.journal.finish()
+
+    def is_unchanged(self, entity_type: str, entity_id: str, workday_hash: str) -> bool:
+        """
+        Check whether an entity was already uploaded to Loop with the same Workday payload
+        """
+        if self.cache is None or self.force:
+            return False
+
+        return self.cache.get(entity_type, entity_id, workday_hash) is not None
+
+    def remember(self, entity_type: str, entity_id: str, workday_hash: str, loop_response: str) -> None:
+        """
+        Record that an entity was uploaded to Loop, if caching is enabled
+        """
+        if self.cache is not None:
+            self.cache.put(entity_type, entity_id, workday_hash, loop_response)
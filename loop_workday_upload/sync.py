@@ -0,0 +1,185 @@
+"""
+Syncing the search results and everything Loop requests, then telling Loop the sync is complete
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from loop_workday_upload.client import LoopClient, WorkdayClient
+from loop_workday_upload.entities import (
+    run_sync_tasks,
+    sync_expense_report,
+    sync_external_committee_member,
+    sync_worker,
+)
+from loop_workday_upload.pipeline import ExpenseReportPipeline, PipelineSettings
+from loop_workday_upload.search import iter_search_result_pages
+from loop_workday_upload.state import SyncContext
+
+
+def sync_entities(
+    context: SyncContext,
+    entities: Mapping[str, List[str]],
+    threads: int,
+    pipeline: Optional[PipelineSettings] = None,
+) -> List[Tuple[str, BaseException]]:
+    """
+    Sync the workers, external committee members, and expense reports requested by Loop
+    """
+    entities = context.registry.claim(entities)
+
+    # Workers and external committee members are synced before expense reports, since reports refer to them
+    people: List[Tuple[str, Callable[[], None]]] = []
+
+    for worker in entities["workers"]:
+        people.append((f"worker {worker}", partial(sync_worker, context, worker)))
+
+    for ecm in entities["external-committee-members"]:
+        people.append((f"external committee member {ecm}", partial(sync_external_committee_member, context, ecm)))
+
+    failures = run_sync_tasks(people, threads)
+
+    if pipeline is not None:
+        return failures + ExpenseReportPipeline(context, pipeline).run(entities["expense-reports"])
+
+    expense_reports: List[Tuple[str, Callable[[], None]]] = []
+
+    for expense_report in entities["expense-reports"]:
+        expense_reports.append(
+            (f"expense report {expense_report}", partial(sync_expense_report, context, expense_report))
+        )
+
+    return failures + run_sync_tasks(expense_reports, threads)
+
+
+def merge_entities(merged: Dict[str, List[str]], entities: Mapping[str, List[str]]) -> None:
+    """
+    Add entities returned by Loop to an existing collection, skipping any that are already present
+    """
+    for key in ("workers", "external-committee-members", "expense-reports"):
+        merged.setdefault(key, [])
+
+        for instance_id in entities[key]:
+            if instance_id not in merged[key]:
+                merged[key].append(instance_id)
+
+
+def upload_search_result_pages(
+    workday: WorkdayClient, loop: LoopClient, chunking_url: str, page_size: int
+) -> Mapping[str, List[str]]:
+    """
+    Upload each page of expense report search results from Workday to Loop as it is retrieved, returning the entities
+    to sync from every page
+    """
+    entities: Dict[str, List[str]] = {"workers": [], "external-committee-members": [], "expense-reports": []}
+
+    for page in iter_search_result_pages(workday, chunking_url, page_size):
+        print("Uploading results to Loop")
+
+        loop_response = loop.upload(
+            "POST", "/api/v1/workday/expense-reports", page.content, endpoint="loop-search-results"
+        )
+
+        if loop_response.status_code != 200:
+            print(loop_response.status_code)
+            print(loop_response.text)
+            raise ValueError("Unexpected response code from Loop")
+
+        print(loop_response.status_code)
+        print(loop_response.json())
+
+        merge_entities(entities, loop_response.json())
+
+    return entities
+
+
+def upload_search_results(
+    workday: WorkdayClient, loop: LoopClient, chunking_urls: List[str], page_size: int
+) -> Mapping[str, List[str]]:
+    """
+    Upload the results of every search from Workday to Loop, with each search's pages retrieved concurrently, returning
+    the entities to sync from all of them without duplicates
+    """
+    # Each search uploads its pages to Loop as they arrive, so Loop's concurrency limit bounds how many are useful
+    with ThreadPoolExecutor(max_workers=max(1, min(len(chunking_urls), loop.concurrency))) as executor:
+        futures = [
+            executor.submit(upload_search_result_pages, workday, loop, chunking_url, page_size)
+            for chunking_url in chunking_urls
+        ]
+
+    entities: Dict[str, List[str]] = {"workers": [], "external-committee-members": [], "expense-reports": []}
+
+    for future in futures:
+        merge_entities(entities, future.result())
+
+    return entities
+
+
+def get_entities_to_sync(loop: LoopClient) -> Mapping[str, List[str]]:
+    """
+    Retrieve the entities that Loop has requested to be synced
+    """
+    loop_response = loop.get("/api/v1/workday/sync")
+
+    if loop_response.status_code != 200:
+        print(loop_response.status_code)
+        print(loop_response.text)
+        raise ValueError("Unexpected response code from Loop")
+
+    print(loop_response.status_code)
+    print(loop_response.json())
+
+    return loop_response.json()  # type: ignore
+
+
+def finish_sync(context: SyncContext, failures: List[Tuple[str, BaseException]]) -> None:
+    """
+    Report any entities that failed to sync, otherwise tell Loop that the sync is complete
+    """
+    if len(failures) > 0:
+        print(f"Failed to sync {len(failures)} entities:")
+
+        for description, exception in failures:
+            print(f"  {description}: {exception!r}")
+
+        raise ValueError("Failed to sync all entities")
+
+    loop_response = context.loop.post("/api/v1/workday/sync")
+
+    if loop_response.status_code != 200:
+        print(loop_response.status_code)
+        print(loop_response.text)
+        raise ValueError("Unexpected response code from Loop")
+
+    context.finish()
+
+
+def sync_all(
+    context: SyncContext,
+    chunking_urls: List[str],
+    page_size: int,
+    threads: int,
+    pipeline: Optional[PipelineSettings] = None,
+) -> None:
+    """
+    Upload the search results to Loop, then sync everything Loop requests
+    """
+    failures = sync_entities(
+        context, upload_search_results(context.workday, context.loop, chunking_urls, page_size), threads, pipeline
+    )
+    # Loop requests entities it needs again, such as those it has lost or marked as stale, so they skip the cache
+    failures += sync_entities(context.requested(), get_entities_to_sync(context.loop), threads, pipeline)
+    finish_sync(context, failures)
+
+
+def sync_requested(context: SyncContext, threads: int, pipeline: Optional[PipelineSettings] = None) -> None:
+    """
+    Sync only what Loop has requested, without searching Workday, if it has requested anything
+    """
+    entities = get_entities_to_sync(context.loop)
+
+    if all(len(entities[key]) == 0 for key in ("workers", "external-committee-members", "expense-reports")):
+        return
+
+    finish_sync(context, sync_entities(context.requested(), entities, threads, pipeline))
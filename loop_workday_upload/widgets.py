@@ -0,0 +1,135 @@
+"""
+Navigating and projecting Workday responses
+"""
+
+from collections import deque
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+# Keys that identify a widget or hold its children, which Loop navigates by, so projection never strips them
+PROJECTION_KEPT_KEYS = frozenset({"id", "ecid", "widget", "body", "children", "rows"})
+
+
+# Keys that only identify a widget, so a widget with nothing else is layout rather than data
+PROJECTION_IDENTITY_KEYS = frozenset({"id", "ecid", "widget"})
+
+
+def find_chunking_url(widgets: Any) -> Optional[str]:
+    """
+    Find the URL to retrieve search results from a flowController response, if it has one
+    """
+    if (
+        isinstance(widgets, Mapping)
+        and "body" in widgets
+        and "children" in widgets["body"]
+        and len(widgets["body"]["children"]) > 2
+        and "chunkingUrl" in widgets["body"]["children"][2]
+    ):
+        return widgets["body"]["children"][2]["chunkingUrl"]  # type: ignore
+
+    return None
+
+
+def find_first_value(widgets: Any, key: str) -> Optional[str]:
+    """
+    Find the first string value for a given key anywhere in a Workday response
+    """
+    # Breadth-first, so values near the top of the response are found first
+    pending = deque([widgets])
+
+    while len(pending) > 0:
+        item = pending.popleft()
+
+        if isinstance(item, Mapping):
+            if isinstance(item.get(key), str):
+                return item[key]  # type: ignore
+
+            pending.extend(item.values())
+        elif isinstance(item, list):
+            pending.extend(item)
+
+    return None
+
+
+def search_for_key_value_pair(widgets: Any, key: str, value: str) -> list[Mapping[str, Any]]:
+    """
+    Search through Workday widgets to find one with a given key-value pair.
+    """
+    results = []
+
+    if isinstance(widgets, Mapping) and key in widgets.keys() and widgets[key] == value:
+        results.append(widgets)
+    elif isinstance(widgets, Mapping):
+        for item in widgets:
+            results.extend(search_for_key_value_pair(widgets[item], key, value))
+    elif isinstance(widgets, list):
+        for item in widgets:
+            results.extend(search_for_key_value_pair(item, key, value))
+
+    return results
+
+
+class WidgetIndex:  # pylint: disable=too-few-public-methods
+    """
+    Index of Workday widgets by key-value pair, built in one pass so repeated lookups don't re-walk the tree
+    """
+
+    def __init__(self, widgets: Any, keys: Tuple[str, ...] = ("instanceId", "widget", "label")) -> None:
+        self.widgets = widgets
+        self.keys = keys
+        self.index: Dict[Tuple[str, str], List[Mapping[str, Any]]] = {}
+
+        # Each pending item carries the pairs its ancestors matched, since search_for_key_value_pair doesn't look
+        # inside a widget once it matches
+        pending: List[Tuple[Any, Tuple[Tuple[str, str], ...]]] = [(widgets, ())]
+
+        while len(pending) > 0:
+            item, matched = pending.pop()
+
+            if isinstance(item, Mapping):
+                for key in keys:
+                    value = item.get(key)
+
+                    if isinstance(value, str) and (key, value) not in matched:
+                        self.index.setdefault((key, value), []).append(item)
+                        matched = matched + ((key, value),)
+
+                pending.extend((child, matched) for child in reversed(list(item.values())))
+            elif isinstance(item, list):
+                pending.extend((child, matched) for child in reversed(item))
+
+    def find(self, key: str, value: str) -> List[Mapping[str, Any]]:
+        """
+        Find all widgets with a given key-value pair, in the same order as search_for_key_value_pair
+        """
+        if key not in self.keys:
+            return search_for_key_value_pair(self.widgets, key, value)
+
+        return self.index.get((key, value), [])
+
+
+def project_widgets(widgets: Any) -> Tuple[Any, bool]:
+    """
+    Strip values that carry no data out of a Workday payload, returning the projection and whether any data is left
+    """
+    if isinstance(widgets, Mapping):
+        projected = {}
+        found = False
+
+        for key, value in widgets.items():
+            value, has_data = project_widgets(value)
+
+            if has_data or key in PROJECTION_KEPT_KEYS:
+                projected[key] = value
+
+            found = found or (has_data and key not in PROJECTION_IDENTITY_KEYS)
+
+        return projected, found
+
+    if isinstance(widgets, list):
+        items = [project_widgets(item) for item in widgets]
+
+        # Items are never removed from lists, since Loop looks some widgets up by position
+        return [item for item, _ in items], any(has_data for _, has_data in items)
+
+    # False and 0 are answers, such as an unchecked box, so only missing values and empty strings are stripped
+    return widgets, widgets is not None and widgets != ""